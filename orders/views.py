@@ -1,6 +1,7 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from shop.idempotency import idempotent
 from shop.models import Order
 
 @api_view(['POST'])
@@ -26,6 +27,7 @@ def update_order_status(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_order(request):
     user = request.user
     address = request.data.get("address")
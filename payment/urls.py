@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import process_payment
+from .views import create_session, payment_webhook
 
 urlpatterns = [
-    path("process/", process_payment, name="process_payment"),
+    path("session/", create_session, name="payment_session"),
+    # Старый адрес оплаты: теперь тоже только открывает сессию в шлюзе
+    path("process/", create_session, name="payment_process"),
+    path("webhook/", payment_webhook, name="payment_webhook"),
 ]
@@ -1,32 +1,76 @@
-import requests
-from django.conf import settings
-from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
-from orders.models import Order
-
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-def process_payment(request):
-    user = request.user
-    order_id = request.data.get("order_id")
-    payment_method = request.data.get("payment_method")
+"""
+Оплата через платёжный шлюз (shop/payments.py), без ожидания банка в потоке запроса:
 
+* POST session/ — async-view создаёт платёж в ожидании и сессию в шлюзе,
+  возвращает ссылку на оплату;
+* POST webhook/ — банк сообщает итог, тело подписано HMAC (PAYMENT_WEBHOOK_SECRET);
+* зависшие платежи сверяет команда reconcile_payments.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from rest_framework import exceptions, status
+
+from shop.async_views import aauthenticate, async_api, json_response, parse_body
+from shop.models import Order, Payment
+from shop.payments import PaymentGatewayError, apply_payment_result, get_gateway, verify_signature
+
+
+SIGNATURE_HEADER = "X-Payment-Signature"
+
+
+@async_api(["POST"])
+async def create_session(request):
+    user = await aauthenticate(request)
+    data = parse_body(request)
+    order_id = data.get("order_id")
+    payment_method = data.get("payment_method")
     if not order_id or not payment_method:
-        return Response({"error": "Нужны order_id и payment_method"}, status=400)
+        return json_response({"error": "Нужны order_id и payment_method"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        order = Order.objects.get(id=order_id, user=user)
-    except Order.DoesNotExist:
-        return Response({"error": "Заказ не найден"}, status=404)
-
-    # Генерация ссылки на оплату
-    payment_link = f"https://bank.com/pay?amount={order.total_price}&phone=+992927870019"
+        order = await Order.objects.filter(id=order_id, user=user).afirst()
+    except (TypeError, ValueError):
+        order = None
+    if order is None:
+        raise Http404
+    if order.status != "pending":
+        return json_response({"error": "Заказ не ожидает оплаты"}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Здесь можно добавить логику обработки платежа через API банка
+    payment, created = await Payment.objects.aget_or_create(
+        order=order, defaults={"method": payment_method, "amount": order.total_price},
+    )
+    if payment.status == "paid":
+        return json_response({"error": "Этот заказ уже оплачен"}, status=status.HTTP_400_BAD_REQUEST)
+    if payment.status == "needs_review":
+        # Деньги, возможно, уже списаны банком — новая сессия затёрла бы этот платёж
+        return json_response({"error": "Платёж проверяется, повторная оплата невозможна"}, status=status.HTTP_409_CONFLICT)
+    # Повторный запрос возвращает уже открытую сессию; новая — только для нового или неудавшегося платежа
+    if created or payment.status == "failed" or not payment.session_id:
+        payment.method = payment_method
+        payment.amount = order.total_price
+        try:
+            session = await get_gateway().acreate_session(payment)
+        except PaymentGatewayError:
+            return json_response({"error": "Платёжный шлюз недоступен"}, status=status.HTTP_502_BAD_GATEWAY)
+        payment.status = "pending"
+        payment.session_id, payment.payment_url = session
+        await payment.asave(update_fields=["method", "amount", "status", "session_id", "payment_url", "updated_at"])
 
-    return Response({
+    return json_response({
         "message": "Оплата успешно инициирована!",
-        "order_id": order_id,
-        "payment_link": payment_link
-    }, status=200)
+        "order_id": order.id,
+        "payment_id": payment.id,
+        "payment_link": payment.payment_url,
+    }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+@async_api(["POST"])
+async def payment_webhook(request):
+    """{"session_id": ..., "status": "paid" | "failed"}; повторная доставка ничего не меняет."""
+    if not verify_signature(request.body, request.headers.get(SIGNATURE_HEADER)):
+        raise exceptions.PermissionDenied("Неверная подпись")
+    data = parse_body(request)
+    payment = await sync_to_async(apply_payment_result)(data.get("session_id"), data.get("status"))
+    if payment is None:
+        raise Http404
+    return json_response({"payment_id": payment.id, "status": payment.status})
@@ -1,6 +1,38 @@
 from django.contrib import admin
-from .models import Product, Order, Bonus
+from .models import Category, Product, Order, Bonus, BonusTransaction
 
+admin.site.register(Category)
 admin.site.register(Product)
-admin.site.register(Order)
-admin.site.register(Bonus)
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "total_price", "created_at")
+    list_filter = ("status",)
+    # __str__ заказа обращается к user — подтягиваем его JOIN'ом, а не запросом на строку
+    list_select_related = ("user",)
+
+
+@admin.register(BonusTransaction)
+class BonusTransactionAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "kind", "amount", "order", "created_at")
+    list_filter = ("kind",)
+    list_select_related = ("user",)
+
+    # Журнал пишется только через shop/bonuses.py вместе с балансом; исправления — новой операцией adjustment
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Bonus)
+class BonusAdmin(admin.ModelAdmin):
+    list_display = ("user", "total_bonus")
+    list_select_related = ("user",)
+    # Баланс — сумма журнала; менять его можно только операциями (shop/bonuses.py)
+    readonly_fields = ("total_bonus",)
@@ -0,0 +1,192 @@
+from datetime import datetime, time, timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Sum, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DailyCategorySales, DailyProductSales, DailySales, Order, OrderItem
+
+
+# Переход в эти статусы учитывает заказ в продажах (один раз), отмена — вычитает
+RECORD_STATUSES = {"paid", "delivered"}
+
+REPORT_GROUPS = ("day", "category", "product")
+REPORT_DEFAULT_DAYS = 30
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+def _line_revenue():
+    money = DecimalField(max_digits=14, decimal_places=2)
+    current_price = Case(
+        When(product__discount_price__gt=0, then=F("product__discount_price")),
+        default=F("product__price"),
+        output_field=money,
+    )
+    return ExpressionWrapper(Coalesce("unit_price", current_price) * F("quantity"), output_field=money)
+
+
+def _totals(queryset):
+    return queryset.annotate(
+        orders=Count("order_id", distinct=True),
+        units=Sum("quantity"),
+        revenue=Sum(_line_revenue()),
+    )
+
+
+def _upsert(model, keys, rows, sign):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) итоги в сводке одним
+    INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x: параллельные
+    заказы одного дня не теряют обновления друг друга.
+    """
+    if not rows:
+        return
+    table = model._meta.db_table
+    key_columns = [model._meta.get_field(key).column for key in keys]
+    values = ["orders", "units", "revenue"]
+    placeholders = ", ".join([f"({', '.join(['%s'] * (len(keys) + len(values)))})"] * len(rows))
+    params = [
+        param
+        for row in rows
+        for param in [*(row[key] for key in keys), *(sign * row[value] for value in values)]
+    ]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(key_columns + values)}) VALUES {placeholders} "
+        f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+        + ", ".join(f"{value} = {table}.{value} + excluded.{value}" for value in values)
+    )
+    with connections[router.db_for_write(model)].cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def apply_sales(order_ids, sign=1):
+    """Добавляет позиции заказов в сводки: три агрегирующих запроса и три upsert'а на пачку."""
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    day = TruncDate("order__created_at")
+    _upsert(DailySales, ["day"], list(_totals(items.values(day=day))), sign)
+    _upsert(
+        DailyCategorySales, ["day", "category"],
+        list(_totals(items.values(day=day, category=F("product__category_id")))), sign,
+    )
+    _upsert(DailyProductSales, ["day", "product"], list(_totals(items.values("product", day=day))), sign)
+
+
+@transaction.atomic
+def record_sales(order_ids):
+    """Учитывает ещё не учтённые заказы; флаг sales_recorded под блокировкой строк не даёт учесть дважды."""
+    claimed = list(
+        Order.objects.select_for_update().filter(id__in=order_ids, sales_recorded=False).values_list("id", flat=True)
+    )
+    if claimed:
+        Order.objects.filter(id__in=claimed).update(sales_recorded=True)
+        apply_sales(claimed)
+    return claimed
+
+
+@transaction.atomic
+def unrecord_sales(order_ids):
+    claimed = list(
+        Order.objects.select_for_update().filter(id__in=order_ids, sales_recorded=True).values_list("id", flat=True)
+    )
+    if claimed:
+        Order.objects.filter(id__in=claimed).update(sales_recorded=False)
+        apply_sales(claimed, sign=-1)
+    return claimed
+
+
+def sync_order_sales(order_ids, status):
+    """Вызывается при смене статуса заказов (Order.save, OrderQuerySet.transition_to)."""
+    if status in RECORD_STATUSES:
+        record_sales(order_ids)
+    elif status == "cancelled":
+        unrecord_sales(order_ids)
+
+
+def _day_range(date_from, date_to):
+    """Границы дней -> фильтр по created_at диапазоном (date_to включительно)."""
+    filters = {}
+    if date_from:
+        filters["created_at__gte"] = timezone.make_aware(datetime.combine(date_from, time.min))
+    if date_to:
+        filters["created_at__lt"] = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    return filters
+
+
+def _rollup_range(date_from, date_to):
+    filters = {}
+    if date_from:
+        filters["day__gte"] = date_from
+    if date_to:
+        filters["day__lte"] = date_to
+    return filters
+
+
+def rebuild_sales(date_from=None, date_to=None, batch_size=1000):
+    """
+    Пересчитывает сводки за период (для заполнения истории и после ручных
+    правок). Учтёнными считаются уже учтённые заказы и заказы в статусах
+    RECORD_STATUSES, кроме отменённых; позиции читаются пачками по batch_size
+    заказов. Возвращает число учтённых заказов.
+    """
+    orders = Order.objects.filter(**_day_range(date_from, date_to))
+    with transaction.atomic():
+        orders.filter(status="cancelled", sales_recorded=True).update(sales_recorded=False)
+        orders.filter(status__in=RECORD_STATUSES, sales_recorded=False).update(sales_recorded=True)
+        for model in (DailySales, DailyCategorySales, DailyProductSales):
+            model.objects.filter(**_rollup_range(date_from, date_to)).delete()
+
+        order_ids = list(orders.filter(sales_recorded=True).order_by("id").values_list("id", flat=True))
+        for start in range(0, len(order_ids), batch_size):
+            apply_sales(order_ids[start:start + batch_size])
+    return len(order_ids)
+
+
+def _parse_day(value, name):
+    day = parse_date(value) if value else None
+    if value and day is None:
+        raise AnalyticsError(f"{name}: ожидается дата в формате ГГГГ-ММ-ДД")
+    return day
+
+
+def sales_report(group="day", date_from=None, date_to=None, limit=50):
+    """
+    Отчёт о продажах только по сводкам: итоги периода и строки по дням,
+    категориям или товарам (по убыванию выручки). По умолчанию — последние
+    REPORT_DEFAULT_DAYS дней.
+    """
+    if group not in REPORT_GROUPS:
+        raise AnalyticsError(f"group: допустимые значения {', '.join(REPORT_GROUPS)}")
+    date_to = _parse_day(date_to, "date_to") or timezone.localdate()
+    date_from = _parse_day(date_from, "date_from") or date_to - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    if date_from > date_to:
+        raise AnalyticsError("date_from позже date_to")
+
+    period = _rollup_range(date_from, date_to)
+    sums = {"orders": Sum("orders"), "units": Sum("units"), "revenue": Sum("revenue")}
+    totals = DailySales.objects.filter(**period).aggregate(**sums)
+    if group == "day":
+        results = DailySales.objects.filter(**period).order_by("day").values("day", "orders", "units", "revenue")
+    elif group == "category":
+        results = (
+            DailyCategorySales.objects.filter(**period)
+            .values("category_id", name=F("category__name"))
+            .annotate(**sums).order_by("-revenue", "category_id")[:limit]
+        )
+    else:
+        results = (
+            DailyProductSales.objects.filter(**period)
+            .values("product_id", title=F("product__title"))
+            .annotate(**sums).order_by("-revenue", "product_id")[:limit]
+        )
+    return {
+        "group": group,
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": {key: value or 0 for key, value in totals.items()},
+        "results": list(results),
+    }
@@ -0,0 +1,212 @@
+"""
+Асинхронные версии горячих эндпоинтов (под ASGI не занимают поток на запрос).
+
+DRF не умеет async-view, поэтому это обычные async-функции Django: JWT
+проверяется тем же CachedJWTAuthentication, данные читаются асинхронным ORM
+через .values() и RowBuilder, ответ кодируется FastJSONRenderer. Формат
+ответов и ошибок совпадает с синхронными view.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, serializers, status
+from rest_framework.request import Request
+
+from .authentication import CachedJWTAuthentication
+from .cache import catalog_cache
+from .conditional import aconditional_response, acatalog_watermark, aproduct_watermark
+from .filters import ProductFilterBackend, get_product_ordering
+from .models import Cart, Order, Product
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .rows import RowBuilder
+from .serializers import (
+    CartLineInputSerializer, CartLineSerializer, CartSerializer, ProductListSerializer, ProductSerializer,
+)
+
+
+_jwt = CachedJWTAuthentication()
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type="application/json")
+
+
+def async_api(methods):
+    """Разрешённые методы, ошибки DRF (APIException, Http404) — в JSON, как у APIView."""
+
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return json_response(
+                    {"detail": str(exceptions.MethodNotAllowed(request.method).detail)},
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                )
+            try:
+                return await view(Request(request), *args, **kwargs)
+            except Http404:
+                error = exceptions.NotFound()
+            except exceptions.APIException as e:
+                error = e
+            data = error.detail if isinstance(error.detail, (dict, list)) else {"detail": error.detail}
+            response = json_response(data, status=error.status_code)
+            if error.status_code == status.HTTP_401_UNAUTHORIZED:
+                response["WWW-Authenticate"] = _jwt.authenticate_header(request)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+async def aauthenticate(request):
+    """JWT из заголовка Authorization -> активный пользователь; иначе 401."""
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise exceptions.NotAuthenticated()
+    user = await _jwt.aget_user(_jwt.get_validated_token(raw_token))
+    # Как и DRF, кладём пользователя в HttpRequest — его видит ReplicaPinningMiddleware
+    request.user = user
+    return user
+
+
+def parse_body(request):
+    try:
+        return json.loads(request.body or b"{}")
+    except ValueError:
+        raise exceptions.ParseError()
+
+
+# ===================== #
+#      ПРОДУКТЫ        #
+# ===================== #
+
+def product_builder(request, list_view):
+    fields = ProductSerializer.parse_fields(request.query_params.get("fields"))
+    serializer_class = ProductListSerializer if list_view and not fields else ProductSerializer
+    return RowBuilder(serializer_class(context={"request": request, "fields": fields}))
+
+
+async def build_product_page(request):
+    builder = product_builder(request, list_view=True)
+    paginator = KeysetPagination()
+    paginator.ordering = get_product_ordering(request)
+    queryset = ProductFilterBackend().filter_queryset(request, Product.objects.all(), None)
+    columns = builder.columns + [
+        name.lstrip("-") for name in paginator.ordering if name.lstrip("-") not in builder.columns
+    ]
+    page = await paginator.apaginate_queryset(queryset.values(*columns), request)
+    return {"next": paginator.get_next_link(), "results": [builder.build(row) for row in page]}
+
+
+@async_api(["GET"])
+async def product_list(request):
+    """GET /api/async/products/ — как /api/products/: фильтры, сортировка, курсор, ?fields, ETag."""
+    modified_at = await acatalog_watermark()
+
+    async def respond():
+        key = catalog_cache.make_key("list", f"{request.get_full_path()}|{modified_at}")
+        return json_response(await catalog_cache.aread_through(key, lambda: build_product_page(request)))
+
+    return await aconditional_response(request, modified_at, respond)
+
+
+@async_api(["GET"])
+async def product_detail(request, pk):
+    modified_at = await aproduct_watermark(pk)
+    if modified_at is None:
+        raise Http404
+
+    async def build():
+        builder = product_builder(request, list_view=False)
+        row = await Product.objects.filter(pk=pk).values(*builder.columns).afirst()
+        if row is None:
+            raise Http404
+        return builder.build(row)
+
+    async def respond():
+        key = catalog_cache.make_key("detail", f"{request.get_full_path()}|{modified_at}")
+        return json_response(await catalog_cache.aread_through(key, build))
+
+    return await aconditional_response(request, modified_at, respond)
+
+
+# ===================== #
+#       КОРЗИНА        #
+# ===================== #
+
+@async_api(["GET"])
+async def cart_summary(request):
+    """Асинхронная версия GET /api/cart/summary/."""
+    user = await aauthenticate(request)
+    builder = RowBuilder(CartLineSerializer(context={"request": request}))
+    queryset = Cart.objects.filter(user=user).with_totals()
+    rows = [row async for row in queryset.values(*builder.columns, "cart_subtotal", "cart_item_count")]
+    totals = rows[0] if rows else {}
+    return json_response({
+        "items": [builder.build(row) for row in rows],
+        "subtotal": serializers.DecimalField(max_digits=12, decimal_places=2).to_representation(
+            totals.get("cart_subtotal", 0)
+        ),
+        "item_count": totals.get("cart_item_count", 0),
+    })
+
+
+@async_api(["POST"])
+async def cart_add(request):
+    user = await aauthenticate(request)
+    serializer = CartLineInputSerializer(data=parse_body(request))
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    product_id = serializer.validated_data["product_id"]
+    quantity = serializer.validated_data["quantity"] or 1
+    if not await Product.objects.filter(id=product_id).aexists():
+        return json_response({"error": "Товар не найден"}, status=status.HTTP_404_NOT_FOUND)
+
+    # INSERT ... ON CONFLICT ... RETURNING идёт через сырой курсор, у которого нет async-версии
+    [(cart_id, _, _)] = await sync_to_async(Cart.objects.add_lines)(user, {product_id: quantity})
+    cart_item = await Cart.objects.select_related("product__category").aget(pk=cart_id)
+    return json_response(CartSerializer(cart_item, context={"request": request}).data, status=status.HTTP_201_CREATED)
+
+
+# ===================== #
+#       ЗАКАЗЫ         #
+# ===================== #
+
+@async_api(["GET", "POST"])
+async def order_status(request, order_id):
+    """GET — статус своего заказа (клиент опрашивает после оплаты), POST — смена статуса администратором."""
+    user = await aauthenticate(request)
+    if request.method == "GET":
+        orders = Order.objects.all() if user.is_staff else Order.objects.filter(user=user)
+        current = await orders.filter(id=order_id).values_list("status", flat=True).afirst()
+        if current is None:
+            raise Http404
+        return json_response({"order_id": order_id, "status": current})
+
+    if not user.is_staff:
+        raise exceptions.PermissionDenied()
+    order = await Order.objects.filter(id=order_id).afirst()
+    if order is None:
+        raise Http404
+    new_status = parse_body(request).get("status")
+    if not new_status:
+        return json_response({"error": "Не указан статус"}, status=status.HTTP_400_BAD_REQUEST)
+    if new_status not in dict(Order.STATUS_CHOICES):
+        return json_response({"error": "Некорректный статус заказа"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # transition_to проверяет STATUS_TRANSITIONS под блокировкой строки и пишет уведомление в outbox
+    changed = await sync_to_async(Order.objects.filter(id=order_id).transition_to)(new_status)
+    if not changed:
+        return json_response(
+            {"error": f"Переход из статуса {order.status} в {new_status} запрещён"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return json_response({"message": "Статус заказа обновлён!", "new_status": new_status})
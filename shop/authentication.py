@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, который берёт пользователя из кэша на AUTH_USER_CACHE_TIMEOUT
+    секунд, а не читает auth_user на каждый запрос. Запись сбрасывается при
+    любом сохранении или удалении пользователя (shop/signals.py). Массовый
+    User.objects.update() сигналов не шлёт: после него нужен invalidate_cached_user().
+
+    Сброс сразу виден всем воркерам только при общем кэше (Redis, Memcached).
+    С LocMemCache по умолчанию у каждого процесса свой кэш, поэтому смена
+    пароля, блокировка и права staff доходят до других процессов не позже чем
+    через AUTH_USER_CACHE_TIMEOUT секунд — отсюда короткий срок по умолчанию.
+    """
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return self.check_user(validated_token, user)
+
+    async def aget_user(self, validated_token):
+        """get_user для async-view."""
+        user_id = self.get_user_id(validated_token)
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+            if user is not None:
+                await cache.aset(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return self.check_user(validated_token, user)
+
+    def check_user(self, validated_token, user):
+        # Те же проверки, что и в JWTAuthentication.get_user
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
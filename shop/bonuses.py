@@ -0,0 +1,88 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Value, When
+
+from .models import Bonus, BonusTransaction, Order
+
+
+class InsufficientBonus(ValueError):
+    def __init__(self):
+        super().__init__("Недостаточно бонусов")
+
+
+def get_balance(user):
+    """Баланс — одна строка по уникальному user, журнал не суммируется."""
+    return Bonus.objects.filter(user=user).values_list("total_bonus", flat=True).first() or 0
+
+
+def _per_user_case(amounts):
+    return Case(
+        *[When(user_id=user_id, then=Value(amount)) for user_id, amount in amounts.items()],
+        output_field=IntegerField(),
+    )
+
+
+@transaction.atomic
+def post_entries(entries):
+    """
+    Записывает операции в журнал одним bulk INSERT и двигает балансы всех
+    затронутых пользователей одним UPDATE ``total_bonus = total_bonus + CASE ...``.
+    Только для начислений: списания идут через debit() с проверкой остатка.
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+    amounts = defaultdict(int)
+    for entry in entries:
+        amounts[entry.user_id] += entry.amount
+    BonusTransaction.objects.bulk_create(entries)
+    # Счета, которых ещё нет, создаём; уже существующие не трогаем
+    Bonus.objects.bulk_create([Bonus(user_id=user_id) for user_id in amounts], ignore_conflicts=True)
+    Bonus.objects.filter(user_id__in=amounts).update(total_bonus=F("total_bonus") + _per_user_case(amounts))
+    return entries
+
+
+def credit(user_id, amount, kind="adjustment", order=None):
+    post_entries([BonusTransaction(user_id=user_id, order=order, kind=kind, amount=amount)])
+
+
+@transaction.atomic
+def debit(user_id, amount, kind="redemption", order=None):
+    """
+    Списывает бонусы условным UPDATE ``... WHERE total_bonus >= amount``:
+    проверка и списание — одна операция в БД, параллельные списания не
+    уводят баланс в минус. При нехватке бросает InsufficientBonus.
+    """
+    updated = Bonus.objects.filter(user_id=user_id, total_bonus__gte=amount).update(
+        total_bonus=F("total_bonus") - amount
+    )
+    if not updated:
+        raise InsufficientBonus()
+    BonusTransaction.objects.create(user_id=user_id, order=order, kind=kind, amount=-amount)
+
+
+def accrual_amount(total_price):
+    return int(total_price * settings.BONUS_ACCRUAL_PERCENT // 100)
+
+
+def accrue_delivered_orders(batch_size=500):
+    """
+    Начисляет бонусы одной пачке доставленных заказов, за которые ещё не
+    начисляли. Повторное начисление за заказ отсекает уникальный индекс
+    журнала: пересёкшаяся пачка другого воркера откатится целиком.
+    """
+    with transaction.atomic():
+        accrued = BonusTransaction.objects.filter(order=OuterRef("pk"), kind="accrual")
+        rows = list(
+            Order.objects.filter(~Exists(accrued), status="delivered")
+            .select_for_update(skip_locked=True)
+            .order_by("id")
+            .values_list("id", "user_id", "total_price")[:batch_size]
+        )
+        post_entries(
+            BonusTransaction(user_id=user_id, order_id=order_id, kind="accrual", amount=accrual_amount(total_price))
+            for order_id, user_id, total_price in rows
+        )
+    return len(rows)
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+CATALOG_VERSION_KEY = "catalog:version"
+# Так в кэше хранится build() -> None (пустой каталог): сам None означает промах
+NONE_MARKER = "catalog:none"
+
+
+def _pack(value):
+    return NONE_MARKER if value is None else value
+
+
+def _unpack(value):
+    return None if value == NONE_MARKER else value
+
+
+class LocalLRUCache:
+    """Небольшой потокобезопасный LRU-кэш внутри процесса с TTL записей."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CatalogCache:
+    """
+    Двухуровневый read-through кэш ответов каталога.
+
+    Первый уровень — LRU в памяти процесса, второй — общий бэкенд Django
+    (``CACHES["default"]``). Ключи содержат версию каталога: любое изменение
+    товара увеличивает версию, и старые записи просто перестают читаться.
+    При промахе пересчёт выполняет только один воркер (блокировка через
+    ``cache.add``), остальные коротко ждут его результат. Результат None
+    тоже кэшируется (как NONE_MARKER).
+    """
+
+    def __init__(self):
+        self.local = LocalLRUCache(settings.CATALOG_CACHE_LOCAL_SIZE)
+        self._version = None
+        self._version_checked_at = 0.0
+
+    def get_version(self):
+        # Версию из общего кэша перечитываем не чаще раза в CATALOG_CACHE_VERSION_TTL секунд
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at > settings.CATALOG_CACHE_VERSION_TTL:
+            version = cache.get(CATALOG_VERSION_KEY)
+            if version is None:
+                version = self._seed_version()
+            self._version = version
+            self._version_checked_at = now
+        return self._version
+
+    def _seed_version(self):
+        # После сброса или вытеснения ключа версия не начинается с 1: время в наносекундах
+        # больше любой прежней версии, и старые записи catalog:v<n>:* не оживают
+        seed = time.time_ns()
+        cache.add(CATALOG_VERSION_KEY, seed, timeout=None)
+        return cache.get(CATALOG_VERSION_KEY, seed)
+
+    def bump_version(self):
+        try:
+            self._version = cache.incr(CATALOG_VERSION_KEY)
+        except ValueError:
+            # Ключа нет — новое затравочное значение уже новее всех прежних
+            self._version = self._seed_version()
+        self._version_checked_at = time.monotonic()
+        self.local.clear()
+
+    def make_key(self, namespace, raw):
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return f"catalog:v{self.get_version()}:{namespace}:{digest}"
+
+    def read_through(self, key, build):
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+
+        value = self.local.get(key)
+        if value is not None:
+            return _unpack(value)
+
+        value = cache.get(key)
+        if value is None:
+            value = self._build_once(key, build, timeout)
+
+        self.local.set(key, value, min(timeout, settings.CATALOG_CACHE_LOCAL_TIMEOUT))
+        return _unpack(value)
+
+    def _build_once(self, key, build, timeout):
+        lock_key = f"{key}:lock"
+        lock_timeout = settings.CATALOG_CACHE_LOCK_TIMEOUT
+        if cache.add(lock_key, 1, timeout=lock_timeout):
+            try:
+                value = _pack(build())
+                cache.set(key, value, timeout)
+                return value
+            finally:
+                cache.delete(lock_key)
+
+        # Кто-то уже пересчитывает этот ключ — ждём его, а не идём в БД следом
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = cache.get(key)
+            if value is not None:
+                return value
+
+        # Владелец блокировки завис или упал — считаем сами
+        value = _pack(build())
+        cache.set(key, value, timeout)
+        return value
+
+    async def aread_through(self, key, build):
+        """read_through для async-view: build — корутина, к общему кэшу обращаемся асинхронно."""
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+
+        value = self.local.get(key)
+        if value is not None:
+            return _unpack(value)
+
+        value = await cache.aget(key)
+        if value is None:
+            value = await self._abuild_once(key, build, timeout)
+
+        self.local.set(key, value, min(timeout, settings.CATALOG_CACHE_LOCAL_TIMEOUT))
+        return _unpack(value)
+
+    async def _abuild_once(self, key, build, timeout):
+        lock_key = f"{key}:lock"
+        lock_timeout = settings.CATALOG_CACHE_LOCK_TIMEOUT
+        if await cache.aadd(lock_key, 1, timeout=lock_timeout):
+            try:
+                value = _pack(await build())
+                await cache.aset(key, value, timeout)
+                return value
+            finally:
+                await cache.adelete(lock_key)
+
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            value = await cache.aget(key)
+            if value is not None:
+                return value
+
+        value = _pack(await build())
+        await cache.aset(key, value, timeout)
+        return value
+
+
+catalog_cache = CatalogCache()
+
+
+_deferred = threading.local()
+
+
+def invalidate_catalog():
+    if getattr(_deferred, "depth", 0):
+        _deferred.pending = True
+        return
+    # После коммита: иначе параллельный запрос успеет закэшировать старые данные под новой версией
+    transaction.on_commit(catalog_cache.bump_version)
+
+
+@contextmanager
+def deferred_invalidation():
+    """Копит сбросы кэша каталога внутри блока и выполняет один в конце (массовый импорт)."""
+    _deferred.depth = getattr(_deferred, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+        if not _deferred.depth and getattr(_deferred, "pending", False):
+            _deferred.pending = False
+            invalidate_catalog()
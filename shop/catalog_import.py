@@ -0,0 +1,154 @@
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+
+from .cache import deferred_invalidation
+from .models import Category, Product
+
+
+IMPORT_FIELDS = ["sku", "title", "description", "price", "discount_price", "category", "stock"]
+# id — запасной ключ для товаров без артикула (заведённых до появления sku)
+PRODUCT_EXPORT_COLUMNS = ["id", "sku", "title", "description", "price", "discount_price", "category", "stock"]
+
+
+class RowError(ValueError):
+    pass
+
+
+def _decimal(value, name, required=False):
+    if value in (None, ""):
+        if required:
+            raise RowError(f"{name}: обязательное поле")
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise RowError(f"{name}: некорректное число {value!r}")
+
+
+def clean_row(row):
+    sku = str(row.get("sku") or "").strip()
+    title = str(row.get("title") or "").strip()
+    category = str(row.get("category") or "").strip()
+    try:
+        product_id = int(row.get("id") or 0) or None
+    except (TypeError, ValueError):
+        raise RowError(f"id: некорректное число {row.get('id')!r}")
+    if not (sku or product_id) or not title or not category:
+        raise RowError("title, category и sku (или id существующего товара) обязательны")
+    try:
+        stock = int(row.get("stock") or 0)
+    except (TypeError, ValueError):
+        raise RowError(f"stock: некорректное число {row.get('stock')!r}")
+    if stock < 0:
+        raise RowError("stock: не может быть отрицательным")
+    return {
+        "id": product_id,
+        "sku": sku or None,
+        "title": title,
+        "description": str(row.get("description") or ""),
+        "price": _decimal(row.get("price"), "price", required=True),
+        "discount_price": _decimal(row.get("discount_price"), "discount_price"),
+        "category": category,
+        "stock": stock,
+    }
+
+
+class ProductImporter:
+    """
+    Upsert товаров по артикулу пачками: на пачку — одно чтение существующих
+    товаров, bulk_create новых, bulk_update изменённых, всё в своей
+    транзакции. Кэш каталога сбрасывается один раз после всего импорта.
+    Строка без артикула обновляет товар по id (так выгружаются старые товары
+    без sku); строка с артикулом и id существующего товара без артикула
+    присваивает ему этот артикул.
+    """
+
+    def __init__(self, batch_size=1000, on_progress=None):
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self.categories = {}
+        self.stats = {"rows": 0, "created": 0, "updated": 0, "errors": []}
+
+    def run(self, rows):
+        started = time.monotonic()
+        batch = []
+        with deferred_invalidation():
+            for line, row in enumerate(rows, start=1):
+                self.stats["rows"] += 1
+                try:
+                    batch.append((line, clean_row(row)))
+                except RowError as e:
+                    self.stats["errors"].append((line, str(e)))
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch)
+                    batch = []
+                    self.report(started)
+            if batch:
+                self.import_batch(batch)
+                self.report(started)
+        self.stats["seconds"] = time.monotonic() - started
+        return self.stats
+
+    def report(self, started):
+        if self.on_progress:
+            elapsed = time.monotonic() - started
+            self.on_progress(self.stats, self.stats["rows"] / elapsed if elapsed else 0.0)
+
+    def resolve_categories(self, names):
+        missing = set(names) - self.categories.keys()
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=missing).values_list("name", "id"))
+
+    @transaction.atomic
+    def import_batch(self, batch):
+        # Последняя строка с тем же артикулом (или id) в пачке побеждает
+        rows = {row["sku"] or row["id"]: (line, row) for line, row in batch}.values()
+        self.resolve_categories({row["category"] for _, row in rows})
+        existing = list(Product.objects.filter(
+            Q(sku__in=[row["sku"] for _, row in rows if row["sku"]])
+            | Q(id__in=[row["id"] for _, row in rows if row["id"]])
+        ))
+        by_sku = {product.sku: product for product in existing if product.sku}
+        by_id = {product.id: product for product in existing}
+
+        to_create, to_update = [], []
+        for line, row in rows:
+            values = dict(row)
+            product_id = values.pop("id")
+            values["category_id"] = self.categories[values.pop("category")]
+            product = by_sku.get(values["sku"])
+            if product is None and product_id in by_id and not (values["sku"] and by_id[product_id].sku):
+                product = by_id[product_id]
+            if not values["sku"]:
+                if product is None:
+                    self.stats["errors"].append((line, f"id: товар {product_id} не найден"))
+                    continue
+                # Без артикула в строке текущий артикул товара не трогаем
+                values.pop("sku")
+            if product is None:
+                to_create.append(Product(**values))
+                continue
+            changed = False
+            for field, value in values.items():
+                if getattr(product, field) != value:
+                    setattr(product, field, value)
+                    changed = True
+            if changed:
+                to_update.append(product)
+
+        if to_create:
+            Product.objects.bulk_create(to_create)
+        if to_update:
+            Product.objects.bulk_update(to_update, IMPORT_FIELDS)
+        self.stats["created"] += len(to_create)
+        self.stats["updated"] += len(to_update)
+
+
+def product_export_queryset():
+    return Product.objects.order_by("id").values_list(
+        "id", "sku", "title", "description", "price", "discount_price", "category__name", "stock",
+    )
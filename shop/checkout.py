@@ -0,0 +1,32 @@
+from django.db import transaction
+
+from .inventory import reserve_stock
+from .models import Cart, Order, OrderItem
+
+
+class EmptyCartError(Exception):
+    pass
+
+
+@transaction.atomic
+def place_order(user, **order_fields):
+    """
+    Оформляет заказ из корзины пользователя за постоянное число запросов:
+    одно чтение корзины вместе с товарами, INSERT заказа, один bulk INSERT
+    позиций, резерв остатков (один условный UPDATE + bulk INSERT) и один
+    DELETE корзины — всё в одной транзакции. При нехватке товара бросает
+    InsufficientStock, и транзакция откатывается целиком.
+    """
+    cart_items = list(Cart.objects.filter(user=user).select_related("product"))
+    if not cart_items:
+        raise EmptyCartError("Корзина пуста")
+
+    total_price = sum(item.product.get_final_price() * item.quantity for item in cart_items)
+    order = Order.objects.create(user=user, total_price=total_price, **order_fields)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=item.product, quantity=item.quantity, unit_price=item.product.get_final_price())
+        for item in cart_items
+    ])
+    reserve_stock(order, [(item.product_id, item.quantity) for item in cart_items])
+    Cart.objects.filter(user=user).delete()
+    return order
@@ -0,0 +1,103 @@
+import hashlib
+from calendar import timegm
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import catalog_cache
+from .models import Category, Product
+
+
+def _latest(*stamps):
+    return max((stamp for stamp in stamps if stamp), default=None)
+
+
+def catalog_watermark():
+    """
+    Момент последнего изменения каталога: самый свежий updated_at товаров и
+    категорий. Удаление товара трогает updated_at его категории (см. signals),
+    поэтому водяной знак сдвигается и при удалениях. Значение кэшируется под
+    версией каталога — в прогретом состоянии запросов к БД нет.
+    """
+    def build():
+        return _latest(
+            Product.objects.aggregate(last=Max("updated_at"))["last"],
+            Category.objects.aggregate(last=Max("updated_at"))["last"],
+        )
+
+    return catalog_cache.read_through(catalog_cache.make_key("watermark", ""), build)
+
+
+async def acatalog_watermark():
+    async def build():
+        return _latest(
+            (await Product.objects.aaggregate(last=Max("updated_at")))["last"],
+            (await Category.objects.aaggregate(last=Max("updated_at")))["last"],
+        )
+
+    return await catalog_cache.aread_through(catalog_cache.make_key("watermark", ""), build)
+
+
+def _product_stamps(pk):
+    return Product.objects.filter(pk=pk).values_list("updated_at", "category__updated_at")
+
+
+def product_watermark(pk):
+    """updated_at карточки с учётом категории (её название входит в ответ) — один запрос по PK."""
+    try:
+        row = _product_stamps(pk).first()
+    except (TypeError, ValueError):
+        return None
+    return _latest(*row) if row else None
+
+
+async def aproduct_watermark(pk):
+    try:
+        row = await _product_stamps(pk).afirst()
+    except (TypeError, ValueError):
+        return None
+    return _latest(*row) if row else None
+
+
+def make_etag(request, modified_at):
+    # Представление зависит от пути с параметрами и от формата (Accept), а не только от данных
+    raw = f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}|{modified_at.isoformat()}"
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def not_modified(request, modified_at):
+    """-> (etag, last_modified, готовый 304 или None)."""
+    etag = make_etag(request, modified_at)
+    last_modified = timegm(modified_at.utctimetuple())
+    return etag, last_modified, get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(request, response, etag, last_modified):
+    if request.method in ("GET", "HEAD") and response.status_code in (200, 304):
+        response.headers.setdefault("ETag", etag)
+        response.headers.setdefault("Last-Modified", http_date(last_modified))
+    return response
+
+
+def conditional_response(request, modified_at, respond):
+    """
+    Проверяет If-None-Match / If-Modified-Since по водяному знаку и отвечает 304,
+    не вызывая respond(); иначе вызывает его и проставляет ETag и Last-Modified.
+    """
+    if modified_at is None:
+        return respond()
+    etag, last_modified, response = not_modified(request, modified_at)
+    if response is None:
+        response = respond()
+    return set_validators(request, response, etag, last_modified)
+
+
+async def aconditional_response(request, modified_at, respond):
+    """conditional_response для async-view: respond — корутина."""
+    if modified_at is None:
+        return await respond()
+    etag, last_modified, response = not_modified(request, modified_at)
+    if response is None:
+        response = await respond()
+    return set_validators(request, response, etag, last_modified)
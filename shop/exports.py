@@ -0,0 +1,94 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order, OrderItem
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Набор данных -> (модель, колонки). Колонки — пути для values_list, всё читается одним JOIN
+EXPORT_DATASETS = {
+    "orders": (Order, [
+        "id", "created_at", "status", "user_id", "user__username",
+        "phone", "address", "total_price",
+    ]),
+    "items": (OrderItem, [
+        "order_id", "order__created_at", "order__status", "order__user_id",
+        "id", "product_id", "product__title", "quantity",
+    ]),
+}
+EXPORT_FORMATS = ("csv", "ndjson")
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _parse_day(value, name):
+    day = parse_date(value) if value else None
+    if value and day is None:
+        raise ExportError(f"{name}: ожидается дата в формате ГГГГ-ММ-ДД")
+    return day
+
+
+def export_queryset(dataset, date_from=None, date_to=None, status=None):
+    """
+    Выборка для выгрузки. Границы дат превращаются в диапазон по created_at
+    (date_to включительно), чтобы работал индекс, а не функция над колонкой.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ExportError(f"dataset: допустимые значения {', '.join(EXPORT_DATASETS)}")
+    model, columns = EXPORT_DATASETS[dataset]
+    prefix = "" if model is Order else "order__"
+
+    filters = {}
+    day = _parse_day(date_from, "date_from")
+    if day:
+        filters[f"{prefix}created_at__gte"] = timezone.make_aware(datetime.combine(day, time.min))
+    day = _parse_day(date_to, "date_to")
+    if day:
+        filters[f"{prefix}created_at__lt"] = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    if status:
+        filters[f"{prefix}status"] = status
+
+    order_by = ["id"] if model is Order else ["order_id", "id"]
+    return model.objects.filter(**filters).order_by(*order_by).values_list(*columns), columns
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи в буфер."""
+
+    def write(self, value):
+        return value
+
+
+def iter_export(queryset, columns, output="csv", header=None):
+    """
+    Генератор строк выгрузки. Записи читаются кусками через .iterator()
+    (серверный курсор на PostgreSQL), поэтому память не зависит от объёма.
+    header — имена колонок в файле, если они отличаются от путей values_list.
+    """
+    columns = header or columns
+    if output not in EXPORT_FORMATS:
+        raise ExportError(f"output: допустимые значения {', '.join(EXPORT_FORMATS)}")
+    rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    if output == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_format_value(value) for value in row])
+    else:
+        for row in rows:
+            record = dict(zip(columns, (_format_value(value) for value in row)))
+            yield json.dumps(record, ensure_ascii=False, default=str) + "\n"
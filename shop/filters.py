@@ -0,0 +1,62 @@
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+# Допустимые сортировки каталога -> ключ курсорной пагинации (последнее поле уникально)
+PRODUCT_ORDERINGS = {
+    "-created_at": ("-created_at", "-id"),
+    "created_at": ("created_at", "id"),
+    "price": ("price", "id"),
+    "-price": ("-price", "-id"),
+}
+DEFAULT_PRODUCT_ORDERING = "-created_at"
+
+
+def get_product_ordering(request):
+    ordering = request.query_params.get("ordering", DEFAULT_PRODUCT_ORDERING)
+    if ordering not in PRODUCT_ORDERINGS:
+        raise ValidationError({"ordering": f"Допустимые значения: {', '.join(PRODUCT_ORDERINGS)}"})
+    return PRODUCT_ORDERINGS[ordering]
+
+
+def _parse_price(request, param):
+    raw = request.query_params.get(param)
+    if raw in (None, ""):
+        return None
+    try:
+        return Decimal(raw)
+    except InvalidOperation:
+        raise ValidationError({param: "Некорректная цена"})
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Фильтры каталога: ?category=<id или название>, ?min_price=, ?max_price=, ?in_stock=1.
+
+    Все условия ложатся на составные индексы Product (category, price|created_at, id),
+    поэтому каждая комбинация — это диапазонное чтение по индексу.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        category = params.get("category")
+        if category:
+            if category.isdigit():
+                queryset = queryset.filter(category_id=int(category))
+            else:
+                queryset = queryset.filter(category__name=category)
+
+        min_price = _parse_price(request, "min_price")
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        max_price = _parse_price(request, "max_price")
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+
+        if params.get("in_stock") in ("1", "true", "True"):
+            queryset = queryset.filter(stock__gt=0)
+
+        return queryset
@@ -0,0 +1,127 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(request):
+    """Тот же ключ с другим запросом — ошибка клиента, а не повтор."""
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def claim_key(user, key, fingerprint):
+    """
+    -> (запись, создана ли). Обычный повтор находится одним SELECT по
+    уникальному (user, key); гонку двух первых запросов разрешает тот же индекс.
+    Просроченный ключ, ещё не удалённый очисткой, занимается заново.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    for _ in range(2):
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is not None and record.expires_at > now:
+            return record, reclaim_abandoned(record, fingerprint, now)
+        if record is not None:
+            record.delete()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, expires_at=expires_at,
+                ), True
+        except IntegrityError:
+            continue
+    return IdempotencyKey.objects.get(user=user, key=key), False
+
+
+def reclaim_abandoned(record, fingerprint, now):
+    """
+    Ключ «в работе» дольше IDEMPOTENCY_IN_FLIGHT_LEASE секунд — процесс, взявший
+    его, упал или завис. Тот же запрос занимает ключ заново условным UPDATE,
+    поэтому из нескольких повторов его получит только один.
+    """
+    lease = timedelta(seconds=settings.IDEMPOTENCY_IN_FLIGHT_LEASE)
+    if record.status_code is not None or record.fingerprint != fingerprint or record.claimed_at > now - lease:
+        return False
+    reclaimed = IdempotencyKey.objects.filter(
+        id=record.id, status_code__isnull=True, claimed_at=record.claimed_at,
+    ).update(claimed_at=now)
+    record.claimed_at = now
+    return bool(reclaimed)
+
+
+def replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {"error": f"{HEADER} уже использован для другого запроса"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        return Response(
+            {"error": "Запрос с этим ключом ещё выполняется"},
+            status=status.HTTP_409_CONFLICT,
+            headers={"Retry-After": "1"},
+        )
+    return Response(record.response, status=record.status_code, headers={REPLAYED_HEADER: "true"})
+
+
+def idempotent(view):
+    """
+    Декоратор POST-обработчика (метода APIView или функции под @api_view).
+    С заголовком Idempotency-Key первый ответ сохраняется на IDEMPOTENCY_KEY_TTL
+    секунд, и повтор с тем же ключом получает его без повторного выполнения.
+    Ответы 5xx и исключения не сохраняются — такой запрос можно повторить.
+    Без заголовка обработчик работает как обычно.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = next(arg for arg in args if isinstance(arg, Request))
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            return Response({"error": f"Некорректный {HEADER}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, created = claim_key(request.user, key, fingerprint)
+        if not created:
+            return replay(record, fingerprint)
+
+        try:
+            response = view(*args, **kwargs)
+        except BaseException:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            IdempotencyKey.objects.filter(id=record.id).update(
+                status_code=response.status_code, response=response.data,
+            )
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys(now=None, batch_size=1000):
+    """Удаляет одну пачку просроченных ключей, возвращает их число."""
+    now = now or timezone.now()
+    batch_ids = list(
+        IdempotencyKey.objects.filter(expires_at__lte=now).order_by("expires_at").values_list("id", flat=True)[:batch_size]
+    )
+    IdempotencyKey.objects.filter(id__in=batch_ids).delete()
+    return len(batch_ids)
@@ -0,0 +1,72 @@
+import io
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_path(image_name, variant):
+    """
+    product_images/photo.jpg -> product_images/variants/thumb/photo.jpg.webp.
+    Расширение исходника остаётся в имени: у photo.jpg и photo.png разные варианты.
+    """
+    directory, filename = posixpath.split(image_name)
+    return posixpath.join(directory, "variants", variant, f"{filename}.{settings.PRODUCT_IMAGE_FORMAT.lower()}")
+
+
+def render_variant(source, size):
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        image.thumbnail(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, settings.PRODUCT_IMAGE_FORMAT, quality=settings.PRODUCT_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_variant(image_name, variant):
+    """
+    Создаёт один вариант изображения, если его ещё нет. Возвращает путь в хранилище.
+    Если исходника нет — FileNotFoundError, если это не изображение — UnidentifiedImageError.
+    """
+    path = variant_path(image_name, variant)
+    if default_storage.exists(path):
+        return path
+    with default_storage.open(image_name, "rb") as source:
+        data = render_variant(source, settings.PRODUCT_IMAGE_VARIANTS[variant])
+    saved = default_storage.save(path, ContentFile(data))
+    if saved != path:
+        # Параллельный запрос успел сохранить тот же вариант — лишняя копия не нужна
+        default_storage.delete(saved)
+    return path
+
+
+def generate_variants(image_name):
+    for variant in settings.PRODUCT_IMAGE_VARIANTS:
+        generate_variant(image_name, variant)
+
+
+def schedule_variants(image_name):
+    """
+    Генерирует варианты вне запроса — в пуле потоков процесса. Если пул
+    выключен (PRODUCT_IMAGE_WORKERS = 0), варианты создаются лениво при
+    первом обращении к ProductImageVariantView.
+    """
+    global _executor
+    if not settings.PRODUCT_IMAGE_WORKERS:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix="product-images",
+            )
+    return _executor.submit(generate_variants, image_name)
@@ -0,0 +1,127 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Order, Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__("Недостаточно товара на складе")
+
+
+def _per_product_case(quantities):
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def merge_quantities(lines):
+    """[(product_id, quantity), ...] -> {product_id: суммарное количество}."""
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return dict(quantities)
+
+
+def find_shortages(quantities):
+    rows = Product.objects.filter(id__in=quantities).values_list("id", "stock")
+    return {product_id: stock for product_id, stock in rows if stock < quantities[product_id]}
+
+
+def decrement_stock(quantities):
+    """
+    Списывает остатки всех товаров одним условным UPDATE:
+    ``stock = stock - qty WHERE id IN (...) AND stock >= qty``.
+    Если хоть одна строка не подошла, бросает InsufficientStock — вызывающий
+    код обязан работать внутри транзакции, чтобы частичное списание откатилось.
+    """
+    if not quantities:
+        return
+    case = _per_product_case(quantities)
+    updated = Product.objects.filter(id__in=quantities, stock__gte=case).update_stock(F("stock") - case)
+    if updated != len(quantities):
+        raise InsufficientStock(list(quantities))
+
+
+def increment_stock(quantities):
+    if quantities:
+        Product.objects.filter(id__in=quantities).update_stock(F("stock") + _per_product_case(quantities))
+
+
+def reserve_stock(order, lines, expires_at=None, status="active"):
+    """Резервирует товар под заказ: одно списание остатков и один bulk INSERT резервов."""
+    quantities = merge_quantities(lines)
+    decrement_stock(quantities)
+    if expires_at is None:
+        expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=product_id, quantity=quantity, status=status, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+@transaction.atomic
+def commit_order_stock(order):
+    """
+    Окончательно списывает товар оплаченного заказа. Активные резервы просто
+    помечаются списанными; если резерв уже истёк и был снят, товар
+    резервируется заново (заказы без резерва, например из админки, — так же).
+    """
+    reservations = StockReservation.objects.filter(order=order)
+    if commit_reservations(reservations):
+        return
+    if reservations.filter(status="committed").exists():
+        return
+    lines = order.items.values_list("product_id", "quantity")
+    reserve_stock(order, lines, expires_at=timezone.now(), status="committed")
+
+
+def commit_reservations(reservations):
+    """Помечает активные резервы списанными: товар уже вычтен из остатка при резервировании."""
+    return reservations.filter(status="active").update(status="committed")
+
+
+# При отмене заказа на склад возвращается и уже списанный товар (отмена оплаченного заказа)
+CANCEL_RELEASE_STATUSES = ("active", "committed")
+
+
+@transaction.atomic
+def release_reservations(reservations, statuses=("active",)):
+    """
+    Снимает резервы в статусах statuses (по умолчанию только активные) и
+    возвращает товар на склад. Возвращает id затронутых заказов.
+    """
+    rows = list(
+        reservations.select_for_update(skip_locked=True)
+        .filter(status__in=statuses)
+        .values_list("id", "order_id", "product_id", "quantity")
+    )
+    if not rows:
+        return set()
+    StockReservation.objects.filter(id__in=[row[0] for row in rows]).update(status="released")
+    increment_stock(merge_quantities((product_id, quantity) for _, _, product_id, quantity in rows))
+    return {row[1] for row in rows}
+
+
+def release_expired_reservations(now=None, batch_size=500):
+    """
+    Снимает одну пачку просроченных резервов и отменяет неоплаченные заказы.
+    Резервы заказов, ушедших дальше pending, не трогает: их товар уже продан.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = StockReservation.objects.filter(
+            status="active", expires_at__lte=now, order__status="pending",
+        ).order_by("expires_at")
+        batch_ids = list(expired.values_list("id", flat=True)[:batch_size])
+        order_ids = release_reservations(StockReservation.objects.filter(id__in=batch_ids))
+        # transition_to, а не update(): покупатель получает уведомление об отмене
+        Order.objects.filter(id__in=order_ids, status="pending").transition_to("cancelled")
+    return len(batch_ids)
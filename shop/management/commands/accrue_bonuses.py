@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.bonuses import accrue_delivered_orders
+
+
+class Command(BaseCommand):
+    help = "Начисляет бонусы за доставленные заказы пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно как фоновый процесс")
+        parser.add_argument("--interval", type=float, default=60, help="Пауза между проходами в секундах")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            accrued = 0
+            while True:
+                count = accrue_delivered_orders(batch_size=batch_size)
+                accrued += count
+                if count < batch_size:
+                    break
+            if accrued:
+                self.stdout.write(f"Начислено бонусов за заказов: {accrued}")
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,96 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+
+from shop.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает синхронный (WSGI) и асинхронный (ASGI) список товаров под одновременной нагрузкой: "
+        "запросов в секунду, p50 и p99. По умолчанию оба приложения запускаются в процессе; "
+        "--wsgi-url/--asgi-url направляют нагрузку на развёрнутые серверы (gunicorn / uvicorn)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--path", default="products/?page_size=50", help="Путь после /api/ и /api/async/")
+        parser.add_argument("--bust-cache", action="store_true", help="Уникальный параметр на запрос — мимо кэша каталога")
+        parser.add_argument("--seed", type=int, default=0, help="Создать столько товаров на время замера")
+        parser.add_argument("--wsgi-url")
+        parser.add_argument("--asgi-url")
+
+    def handle(self, *args, requests, concurrency, path, bust_cache, seed, wsgi_url, asgi_url, **options):
+        seeded = self.seed(seed) if seed else None
+        try:
+            urls = [self.url(path, index, bust_cache) for index in range(requests)]
+            if wsgi_url:
+                wsgi = asyncio.run(self.run_async(httpx.AsyncClient(base_url=wsgi_url), "/api/", urls, concurrency))
+            else:
+                wsgi = self.run_threads(urls, concurrency)
+            client = httpx.AsyncClient(
+                base_url=asgi_url or "http://localhost",
+                transport=None if asgi_url else httpx.ASGITransport(app=get_asgi_application()),
+            )
+            asgi = asyncio.run(self.run_async(client, "/api/async/", urls, concurrency))
+        finally:
+            if seeded:
+                Product.objects.filter(id__in=seeded).delete()
+
+        self.stdout.write(f"Запросов: {requests}, одновременно: {concurrency}, путь: {path}")
+        for name, (elapsed, latencies, errors) in [("WSGI", wsgi), ("ASGI", asgi)]:
+            self.stdout.write(
+                f"  {name}: {requests / elapsed:7.1f} запр/с, p50 {self.percentile(latencies, 50):6.1f} мс, "
+                f"p99 {self.percentile(latencies, 99):6.1f} мс, ошибок {errors}"
+            )
+
+    def seed(self, count):
+        category, _ = Category.objects.get_or_create(name="Бенчмарк")
+        products = Product.objects.bulk_create([
+            Product(title=f"Товар {index}", price=index % 500 + 1, stock=index % 7, category=category)
+            for index in range(count)
+        ], batch_size=500)
+        return [product.id for product in products]
+
+    def url(self, path, index, bust_cache):
+        if not bust_cache:
+            return path
+        return f"{path}{'&' if '?' in path else '?'}bench={index}"
+
+    def run_threads(self, urls, concurrency):
+        """WSGI: как у синхронного сервера — по потоку на одновременный запрос."""
+        client = httpx.Client(base_url="http://localhost", transport=httpx.WSGITransport(app=get_wsgi_application()))
+
+        def fetch(url):
+            started = time.perf_counter()
+            response = client.get(f"/api/{url}")
+            return (time.perf_counter() - started) * 1000, response.status_code != 200
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, urls))
+        return time.perf_counter() - started, [r[0] for r in results], sum(r[1] for r in results)
+
+    async def run_async(self, client, prefix, urls, concurrency):
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with limit:
+                started = time.perf_counter()
+                response = await client.get(f"{prefix}{url}")
+                return (time.perf_counter() - started) * 1000, response.status_code != 200
+
+        async with client:
+            started = time.perf_counter()
+            results = await asyncio.gather(*(fetch(url) for url in urls))
+        return time.perf_counter() - started, [r[0] for r in results], sum(r[1] for r in results)
+
+    def percentile(self, values, percent):
+        return statistics.quantiles(values, n=100)[percent - 1] if len(values) > 1 else values[0]
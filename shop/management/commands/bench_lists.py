@@ -0,0 +1,71 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from shop.models import Category, Product
+from shop.renderers import FastJSONRenderer
+from shop.rows import RowBuilder
+from shop.serializers import ProductListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает сериализацию списка товаров: ProductListSerializer + JSONRenderer "
+        "против .values() + RowBuilder + orjson. Данные создаются во временной транзакции и откатываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, rows, repeat, **options):
+        request = RequestFactory().get("/api/products/", HTTP_HOST="localhost")
+        context = {"request": request}
+        with transaction.atomic():
+            self.create_products(rows)
+            queryset = Product.objects.order_by("-created_at", "-id")[:rows]
+
+            def slow():
+                products = queryset.select_related("category")
+                data = ProductListSerializer(products, many=True, context=context).data
+                return JSONRenderer().render({"results": data})
+
+            def fast():
+                builder = RowBuilder(ProductListSerializer(context=context))
+                data = [builder.build(row) for row in queryset.values(*builder.columns)]
+                return FastJSONRenderer().render({"results": data})
+
+            if slow() != fast():
+                raise CommandError("Быстрый путь отдал не тот же JSON, что сериализатор")
+            slow_time = self.measure(slow, repeat)
+            fast_time = self.measure(fast, repeat)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Товаров в списке: {rows}, повторов: {repeat} (медиана)")
+        self.stdout.write(f"  сериализатор + JSONRenderer: {slow_time * 1000:.1f} мс")
+        self.stdout.write(f"  RowBuilder + orjson:         {fast_time * 1000:.1f} мс")
+        self.stdout.write(self.style.SUCCESS(f"  ускорение: x{slow_time / fast_time:.1f}"))
+
+    def create_products(self, rows):
+        category, _ = Category.objects.get_or_create(name="Бенчмарк")
+        Product.objects.bulk_create([
+            Product(
+                title=f"Товар {index}", description="Описание " * 50, price=Decimal(index % 500) + Decimal("0.99"),
+                discount_price=Decimal(index % 300) if index % 3 else None, category=category,
+                stock=index % 7, image=f"product_images/bench_{index}.jpg" if index % 2 else None,
+            )
+            for index in range(rows)
+        ], batch_size=500)
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
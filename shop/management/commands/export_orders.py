@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.exports import EXPORT_DATASETS, EXPORT_FORMATS, ExportError, export_queryset, iter_export
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка заказов или позиций заказов в CSV/NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dataset", choices=list(EXPORT_DATASETS), default="orders")
+        parser.add_argument("--output-format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--date-from", help="ГГГГ-ММ-ДД включительно")
+        parser.add_argument("--date-to", help="ГГГГ-ММ-ДД включительно")
+        parser.add_argument("--status")
+        parser.add_argument("-o", "--output", help="Файл для записи (по умолчанию stdout)")
+
+    def handle(self, *args, dataset, output_format, date_from, date_to, status, output, **options):
+        try:
+            queryset, columns = export_queryset(dataset, date_from, date_to, status)
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        stream = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+        try:
+            for chunk in iter_export(queryset, columns, output_format):
+                stream.write(chunk)
+        finally:
+            if output:
+                stream.close()
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from shop.catalog_import import PRODUCT_EXPORT_COLUMNS, product_export_queryset
+from shop.exports import EXPORT_FORMATS, iter_export
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка каталога в формате, который принимает import_products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output-format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("-o", "--output", help="Файл для записи (по умолчанию stdout)")
+
+    def handle(self, *args, output_format, output, **options):
+        stream = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+        try:
+            rows = iter_export(
+                product_export_queryset(), PRODUCT_EXPORT_COLUMNS, output_format, header=PRODUCT_EXPORT_COLUMNS,
+            )
+            for chunk in rows:
+                stream.write(chunk)
+        finally:
+            if output:
+                stream.close()
@@ -0,0 +1,46 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_import import ProductImporter
+
+
+def read_rows(path):
+    """Читает файл построчно: CSV с заголовком или JSON Lines; JSON-массив загружается целиком."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif path.endswith(".json"):
+            yield from json.load(f)
+        else:
+            yield from csv.DictReader(f)
+
+
+class Command(BaseCommand):
+    help = "Массовый импорт товаров из CSV/JSON с upsert по артикулу (sku), для товаров без артикула — по id"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл .csv, .jsonl/.ndjson или .json")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, path, batch_size, **options):
+        def progress(stats, rate):
+            self.stdout.write(
+                f"Обработано {stats['rows']} строк: создано {stats['created']}, "
+                f"обновлено {stats['updated']}, ошибок {len(stats['errors'])} — {rate:.0f} строк/с"
+            )
+
+        try:
+            stats = ProductImporter(batch_size=batch_size, on_progress=progress).run(read_rows(path))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line, error in stats["errors"][:20]:
+            self.stderr.write(f"Строка {line}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {stats['seconds']:.1f} с: создано {stats['created']}, обновлено {stats['updated']}, "
+            f"пропущено {len(stats['errors'])}"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from shop.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Удаляет просроченные ключи идемпотентности пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        purged = 0
+        while True:
+            count = purge_expired_keys(batch_size=batch_size)
+            purged += count
+            if count < batch_size:
+                break
+        self.stdout.write(f"Удалено ключей: {purged}")
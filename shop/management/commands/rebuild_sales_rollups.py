@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from shop.analytics import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает дневные сводки продаж по истории заказов (весь период или --date-from/--date-to)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date-from", help="ГГГГ-ММ-ДД")
+        parser.add_argument("--date-to", help="ГГГГ-ММ-ДД, включительно")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, date_from, date_to, batch_size, **options):
+        days = {}
+        for name, value in [("date-from", date_from), ("date-to", date_to)]:
+            days[name] = parse_date(value) if value else None
+            if value and days[name] is None:
+                raise CommandError(f"--{name}: ожидается дата в формате ГГГГ-ММ-ДД")
+        count = rebuild_sales(days["date-from"], days["date-to"], batch_size=batch_size)
+        self.stdout.write(f"Учтено заказов: {count}")
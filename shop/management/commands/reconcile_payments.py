@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.payments import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = "Сверяет со шлюзом платежи, зависшие в ожидании (webhook не пришёл)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно как фоновый процесс")
+        parser.add_argument("--interval", type=float, default=60, help="Пауза между проходами в секундах")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            checked = 0
+            while True:
+                count = reconcile_payments(batch_size=batch_size)
+                checked += count
+                if count < batch_size:
+                    break
+            if checked:
+                self.stdout.write(f"Сверено платежей: {checked}")
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Снимает просроченные резервы товара и отменяет неоплаченные заказы"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно как фоновый процесс")
+        parser.add_argument("--interval", type=float, default=30, help="Пауза между проходами в секундах")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            released = 0
+            while True:
+                count = release_expired_reservations(batch_size=batch_size)
+                released += count
+                if count < batch_size:
+                    break
+            if released:
+                self.stdout.write(f"Снято резервов: {released}")
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.notifications import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Отправляет push-уведомления из очереди пачками с повторами"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно как фоновый процесс")
+        parser.add_argument("--interval", type=float, default=2, help="Пауза, когда очередь пуста, в секундах")
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            processed = 0
+            while True:
+                count = drain_outbox(batch_size=batch_size)
+                processed += count
+                if count < batch_size:
+                    break
+            if processed:
+                self.stdout.write(f"Обработано уведомлений: {processed}")
+            if not loop:
+                break
+            time.sleep(interval)
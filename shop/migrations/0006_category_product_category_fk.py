@@ -0,0 +1,84 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    """Переносим строковые категории товаров в таблицу Category."""
+    Category = apps.get_model('shop', 'Category')
+    Product = apps.get_model('shop', 'Product')
+
+    for raw_name in Product.objects.values_list('category_name', flat=True).distinct():
+        name = raw_name.strip() or 'Без категории'
+        category, _ = Category.objects.get_or_create(name=name)
+        Product.objects.filter(category_name=raw_name).update(category=category)
+
+
+def backwards(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    for product in Product.objects.select_related('category'):
+        product.category_name = product.category.name
+        product.save(update_fields=['category_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название категории')),
+            ],
+            options={
+                'verbose_name': 'Категория',
+                'verbose_name_plural': 'Категории',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='category',
+            new_name='category_name',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='products', to='shop.category', verbose_name='Категория'),
+        ),
+        migrations.RunPython(forwards, backwards),
+        # default нужен только для обратной миграции, которая заново добавит колонку
+        migrations.AlterField(
+            model_name='product',
+            name='category_name',
+            field=models.CharField(default='', max_length=100, verbose_name='Категория'),
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='category_name',
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='products', to='shop.category', verbose_name='Категория'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='product_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'id'], name='product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['created_at', 'id'], name='product_instock_created_idx'),
+        ),
+    ]
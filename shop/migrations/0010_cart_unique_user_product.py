@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Схлопываем дубли (user, product) в одну строку с суммарным количеством."""
+    Cart = apps.get_model('shop', 'Cart')
+    duplicates = (
+        Cart.objects.values('user_id', 'product_id')
+        .annotate(lines=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        Cart.objects.filter(id=row['keep_id']).update(quantity=row['total'])
+        Cart.objects.filter(user_id=row['user_id'], product_id=row['product_id']).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cart_unique_user_product'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_accounts(apps, schema_editor):
+    """Схлопываем дубли счетов пользователя и открываем журнал записью с текущим балансом."""
+    Bonus = apps.get_model('shop', 'Bonus')
+    BonusTransaction = apps.get_model('shop', 'BonusTransaction')
+    duplicates = (
+        Bonus.objects.values('user_id')
+        .annotate(accounts=Count('id'), keep_id=Min('id'), total=Sum('total_bonus'))
+        .filter(accounts__gt=1)
+    )
+    for row in duplicates:
+        Bonus.objects.filter(id=row['keep_id']).update(total_bonus=row['total'])
+        Bonus.objects.filter(user_id=row['user_id']).exclude(id=row['keep_id']).delete()
+    BonusTransaction.objects.bulk_create([
+        BonusTransaction(user_id=user_id, kind='adjustment', amount=total)
+        for user_id, total in Bonus.objects.filter(total_bonus__gt=0).values_list('user_id', 'total_bonus')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BonusTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('accrual', 'Начисление за заказ'), ('redemption', 'Списание'), ('adjustment', 'Корректировка')], max_length=20, verbose_name='Тип операции')),
+                ('amount', models.IntegerField(verbose_name='Сумма (со знаком)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата операции')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bonustransaction',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bonus_transactions', to='shop.order', verbose_name='Заказ'),
+        ),
+        migrations.AddField(
+            model_name='bonustransaction',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bonus_transactions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.RunPython(merge_accounts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bonus',
+            constraint=models.UniqueConstraint(fields=('user',), name='bonus_unique_user'),
+        ),
+        migrations.AddIndex(
+            model_name='bonustransaction',
+            index=models.Index(fields=['user', 'created_at'], name='bonus_tx_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bonustransaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('kind', 'accrual')), fields=('order',), name='bonus_tx_unique_order_accrual'),
+        ),
+    ]
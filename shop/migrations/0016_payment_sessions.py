@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:59
+
+from django.db import migrations, models
+
+
+def rename_paid_status(apps, schema_editor):
+    """Оплата ставила заказу статус «Оплачено», которого нет в STATUS_CHOICES."""
+    Order = apps.get_model('shop', 'Order')
+    Order.objects.filter(status='Оплачено').update(status='paid')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Сумма'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='payment_url',
+            field=models.URLField(blank=True, max_length=1000, verbose_name='Ссылка на оплату'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='session_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='Сессия в шлюзе'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В ожидании'), ('paid', 'Оплачен'), ('processing', 'В обработке'), ('shipped', 'Отправлен'), ('delivered', 'Доставлен'), ('cancelled', 'Отменён')], default='pending', max_length=20, verbose_name='Статус заказа'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('failed', 'Не прошёл'), ('needs_review', 'Требует проверки')], default='pending', max_length=20, verbose_name='Статус оплаты'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'updated_at'], name='payment_status_updated_idx'),
+        ),
+        migrations.RunPython(rename_paid_status, migrations.RunPython.noop),
+    ]
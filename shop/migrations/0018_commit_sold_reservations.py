@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def commit_sold_reservations(apps, schema_editor):
+    """Резервы заказов, ушедших дальше pending, раньше оставались активными — списываем их."""
+    StockReservation = apps.get_model('shop', 'StockReservation')
+    StockReservation.objects.filter(status='active').exclude(
+        order__status__in=['pending', 'cancelled'],
+    ).update(status='committed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(commit_sold_reservations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def mark_delivered_orders_accrued(apps, schema_editor):
+    """
+    Бонусы за заказы, доставленные до появления журнала, уже вошли во
+    входящий баланс (0014_bonus_ledger). Нулевая запись accrual помечает их
+    начисленными, чтобы accrue_bonuses не зачислил их второй раз.
+    """
+    Order = apps.get_model('shop', 'Order')
+    BonusTransaction = apps.get_model('shop', 'BonusTransaction')
+    rows = (
+        Order.objects.filter(status='delivered')
+        .exclude(bonus_transactions__kind='accrual')
+        .values_list('id', 'user_id')
+    )
+    BonusTransaction.objects.bulk_create([
+        BonusTransaction(user_id=user_id, order_id=order_id, kind='accrual', amount=0)
+        for order_id, user_id in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_commit_sold_reservations'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_delivered_orders_accrued, migrations.RunPython.noop),
+    ]
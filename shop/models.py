@@ -1,19 +1,171 @@
 from django.contrib.auth.models import User
-from django.db import models
-from fcm_django.models import FCMDevice
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, router, transaction
+from django.utils import timezone
+
+from .cache import invalidate_catalog
+from .search import get_search_backend
+
+class DirtyFieldsMixin:
+    """
+    Отслеживание изменённых полей без повторного SELECT.
+
+    При загрузке из БД запоминаем значения полей, при save() сравниваем с
+    ними: ``get_dirty_fields()`` сообщает, что изменилось, а update_fields
+    вычисляется автоматически, поэтому UPDATE пишет только изменённые колонки
+    (или не выполняется вовсе, если ничего не менялось).
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Чтение отложенного поля вызывает refresh_from_db(fields=[...]): правки в остальных полях не теряем
+        self._take_snapshot(None if fields is None else {self._meta.get_field(name).attname for name in fields})
+
+    def _take_snapshot(self, attnames=None):
+        deferred = self.get_deferred_fields()
+        snapshot = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred and (attnames is None or field.attname in attnames)
+        }
+        if attnames is None:
+            self._loaded_values = snapshot
+        else:
+            self._loaded_values.update(snapshot)
+
+    def get_loaded_value(self, attname):
+        return getattr(self, "_loaded_values", {}).get(attname)
+
+    def get_dirty_fields(self):
+        """{attname: значение при загрузке} для изменённых полей."""
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None:
+            return {}
+        dirty = {
+            attname: old for attname, old in loaded.items()
+            if getattr(self, attname) != old
+        }
+        # Поле, отложенное через .only()/.defer() и затем присвоенное, в снимок не попало
+        for field in self._meta.concrete_fields:
+            if field.attname not in loaded and field.attname in self.__dict__:
+                dirty[field.attname] = None
+        return dirty
+
+    def save(self, *args, **kwargs):
+        tracked = not self._state.adding and getattr(self, "_loaded_values", None) is not None
+        if tracked and not args and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = list(self.get_dirty_fields())
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if tracked and update_fields is not None:
+            # Запомнить только записанное: остальные несохранённые правки должны остаться «грязными»
+            self._take_snapshot({self._meta.get_field(name).attname for name in update_fields})
+        else:
+            self._take_snapshot()
+
+
+# ======================= #
+#       КАТЕГОРИИ        #
+# ======================= #
+class Category(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name="Название категории")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name = "Категория"
+        verbose_name_plural = "Категории"
+
+    def __str__(self):
+        return self.name
+
 
 # ======================= #
 #        ТОВАРЫ          #
 # ======================= #
+class ProductQuerySet(models.QuerySet):
+    """
+    Массовые операции обходят save()/сигналы, поэтому версию кэша каталога
+    сбрасываем, поисковый индекс и updated_at (auto_now в UPDATE не работает)
+    обновляем здесь.
+    """
+
+    SEARCH_FIELDS = {"title", "description"}
+
+    def update(self, **kwargs):
+        reindex = self.SEARCH_FIELDS & kwargs.keys()
+        ids = list(self.values_list("id", flat=True)) if reindex else None
+        kwargs.setdefault("updated_at", timezone.now())
+        rows = super().update(**kwargs)
+        if reindex:
+            get_search_backend().index_products(self.model.objects.filter(id__in=ids).only("id", "title", "description"))
+        invalidate_catalog()
+        return rows
+
+    def delete(self):
+        result = super().delete()
+        invalidate_catalog()
+        return result
+
+    def bulk_create(self, *args, **kwargs):
+        objs = super().bulk_create(*args, **kwargs)
+        get_search_backend().index_products(objs)
+        invalidate_catalog()
+        return objs
+
+    def update_stock(self, expression):
+        # Остаток меняется на каждом заказе: кэш каталога показывает его с задержкой,
+        # а достоверная проверка идёт условным UPDATE при резервировании (shop/inventory.py).
+        # updated_at всё же двигаем, чтобы ETag карточки сменился вместе с остатком
+        return super().update(stock=expression, updated_at=timezone.now())
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        rows = super().bulk_update(objs, list(dict.fromkeys([*fields, "updated_at"])), *args, **kwargs)
+        if self.SEARCH_FIELDS & set(fields):
+            get_search_backend().index_products(objs)
+        invalidate_catalog()
+        return rows
+
+
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="Артикул")
     title = models.CharField(max_length=255, verbose_name="Название товара")
     description = models.TextField(blank=True, verbose_name="Описание")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Скидочная цена")
-    category = models.CharField(max_length=100, verbose_name="Категория")
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name="products", verbose_name="Категория")
     image = models.ImageField(upload_to="product_images/", blank=True, null=True, verbose_name="Фото товара")
     stock = models.PositiveIntegerField(default=0, verbose_name="Остаток на складе")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Дата изменения")
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Ключ курсорной пагинации каталога (created_at, id)
+            models.Index(fields=["created_at", "id"], name="product_created_id_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            # Фильтр по категории + сортировка по новизне или цене
+            models.Index(fields=["category", "created_at", "id"], name="product_cat_created_idx"),
+            models.Index(fields=["category", "price", "id"], name="product_cat_price_idx"),
+            # Частичный индекс для частого фильтра «только в наличии»
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(stock__gt=0),
+                name="product_instock_created_idx",
+            ),
+        ]
 
     def get_final_price(self):
         return self.discount_price if self.discount_price else self.price
@@ -25,14 +177,60 @@ class Product(models.Model):
 # ======================= #
 #         ЗАКАЗЫ         #
 # ======================= #
-class Order(models.Model):
+class OrderQuerySet(models.QuerySet):
+    def transition_to(self, new_status):
+        """
+        Переводит заказы выборки в new_status одним UPDATE и ставит в очередь
+        уведомления одним bulk INSERT. Заказы, для которых переход не разрешён
+        (см. Order.STATUS_TRANSITIONS), пропускаются. Возвращает id изменённых заказов.
+        """
+        allowed_from = [old for old, targets in Order.STATUS_TRANSITIONS.items() if new_status in targets]
+        with transaction.atomic():
+            rows = list(
+                self.select_for_update().filter(status__in=allowed_from).values_list("id", "user_id", "status")
+            )
+            order_ids = [order_id for order_id, _, _ in rows]
+            if not order_ids:
+                return []
+            Order.objects.filter(id__in=order_ids).update(status=new_status)
+            from .inventory import (  # Избегаем циклического импорта
+                CANCEL_RELEASE_STATUSES, commit_reservations, release_reservations,
+            )
+            if new_status == "cancelled":
+                release_reservations(
+                    StockReservation.objects.filter(order_id__in=order_ids), statuses=CANCEL_RELEASE_STATUSES,
+                )
+            else:
+                # Ушедший из pending заказ продан: резерв списываем, иначе сборщик вернёт товар на склад
+                pending_ids = [order_id for order_id, _, old_status in rows if old_status == "pending"]
+                commit_reservations(StockReservation.objects.filter(order_id__in=pending_ids))
+            from .analytics import sync_order_sales  # Избегаем циклического импорта
+            sync_order_sales(order_ids, new_status)
+            Notification.objects.bulk_create([
+                Order.build_status_notification(order_id, user_id, new_status)
+                for order_id, user_id, _ in rows
+            ])
+        return order_ids
+
+
+class Order(DirtyFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ("pending", "В ожидании"),
+        ("paid", "Оплачен"),
         ("processing", "В обработке"),
         ("shipped", "Отправлен"),
         ("delivered", "Доставлен"),
         ("cancelled", "Отменён"),
     ]
+    # Разрешённые переходы статусов для массовой смены статуса
+    STATUS_TRANSITIONS = {
+        "pending": {"paid", "processing", "shipped", "cancelled"},
+        "paid": {"processing", "shipped", "cancelled"},
+        "processing": {"shipped", "cancelled"},
+        "shipped": {"delivered"},
+        "delivered": set(),
+        "cancelled": set(),
+    }
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders", verbose_name="Покупатель")
     phone = models.CharField(max_length=20, verbose_name="Телефон")
@@ -40,49 +238,63 @@ class Order(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Общая сумма", default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Статус заказа")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата заказа")
+    # Учтён ли заказ в сводках продаж (shop/analytics.py)
+    sales_recorded = models.BooleanField(default=False, verbose_name="Учтён в продажах")
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # История заказов покупателя (курсор по created_at, id)
+            models.Index(fields=["user", "created_at", "id"], name="order_user_created_idx"),
+            # Очереди заказов по статусу для персонала и сборщиков
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+        ]
 
     def calculate_total_price(self):
         self.total_price = sum(item.get_total_price() for item in self.items.all())
         self.save()
 
     def complete_order(self):
-        bonus = self.user.bonuses.first()
-        if bonus:
-            bonus.use_bonus(self.total_price // 10)
-        for item in self.items.all():
-            item.product.stock -= item.quantity
-            item.product.save()
+        from .inventory import commit_order_stock  # Избегаем циклического импорта
+
+        commit_order_stock(self)
         Cart.objects.filter(user=self.user).delete()
         self.status = "shipped"
         self.save()
 
+    @classmethod
+    def build_status_notification(cls, order_id, user_id, status):
+        return Notification(
+            user_id=user_id,
+            title="Обновление заказа",
+            body=f"Ваш заказ №{order_id} теперь в статусе: {dict(cls.STATUS_CHOICES).get(status, status)}!",
+            payload={"order_id": order_id, "status": status},
+        )
+
     def send_order_update_notification(self):
-        """Отправка push-уведомлений при обновлении статуса заказа."""
-        from .models import UserFCMToken  # Избегаем циклического импорта
-
-        try:
-            user_fcm = UserFCMToken.objects.get(user=self.user)
-            if user_fcm.fcm_token:
-                device, created = FCMDevice.objects.get_or_create(
-                    registration_id=user_fcm.fcm_token,
-                    defaults={"type": "android"}
-                )
-                device.send_message(
-                    title="Обновление заказа",
-                    body=f"Ваш заказ №{self.id} теперь в статусе: {self.get_status_display()}!"
-                )
-        except UserFCMToken.DoesNotExist:
-            print(f"FCM-токен для пользователя {self.user.username} не найден")
-        except Exception as e:
-            print(f"Ошибка отправки уведомления: {e}")
+        """Ставит push-уведомление о новом статусе в очередь (отправляет воркер send_notifications)."""
+        self.build_status_notification(self.id, self.user_id, self.status).save()
 
     def save(self, *args, **kwargs):
-        if self.pk:
-            old_order = Order.objects.get(pk=self.pk)
-            if old_order.status != self.status:
-                self.send_order_update_notification()
-
-        super().save(*args, **kwargs)
+        # Старый статус берём из снимка, сделанного при загрузке, а не повторным SELECT
+        if not (self.pk and "status" in self.get_dirty_fields()):
+            super().save(*args, **kwargs)
+            return
+
+        # Смена статуса и запись в очередь уведомлений — в одной транзакции
+        with transaction.atomic():
+            from .inventory import (  # Избегаем циклического импорта
+                CANCEL_RELEASE_STATUSES, commit_reservations, release_reservations,
+            )
+            if self.status == "cancelled":
+                release_reservations(self.reservations.all(), statuses=CANCEL_RELEASE_STATUSES)
+            elif self.get_loaded_value("status") == "pending" and self.status != "pending":
+                commit_reservations(self.reservations.all())
+            self.send_order_update_notification()
+            super().save(*args, **kwargs)
+            from .analytics import sync_order_sales  # Избегаем циклического импорта
+            sync_order_sales([self.pk], self.status)
 
     def __str__(self):
         return f"Заказ #{self.id} - {self.user.username}"
@@ -92,44 +304,198 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items", verbose_name="Заказ")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Товар")
     quantity = models.PositiveIntegerField(verbose_name="Количество")
+    # Цена за единицу на момент оформления; у старых позиций пусто — берётся текущая цена товара
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Цена за единицу")
 
     def get_total_price(self):
-        return self.product.get_final_price() * self.quantity
+        unit_price = self.unit_price if self.unit_price is not None else self.product.get_final_price()
+        return unit_price * self.quantity
 
     def __str__(self):
         return f"{self.product.title} ({self.quantity} шт.)"
 
 
+class StockReservation(models.Model):
+    """Товар, зарезервированный под заказ при оформлении (см. shop/inventory.py)."""
+
+    STATUS_CHOICES = [
+        ("active", "Активен"),
+        ("committed", "Списан"),
+        ("released", "Снят"),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="reservations", verbose_name="Заказ")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations", verbose_name="Товар")
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="active", verbose_name="Статус резерва")
+    expires_at = models.DateTimeField(verbose_name="Действует до")
+
+    class Meta:
+        indexes = [
+            # Выборка просроченных резервов сборщиком
+            models.Index(fields=["status", "expires_at"], name="reservation_status_exp_idx"),
+        ]
+
+    def __str__(self):
+        return f"Резерв {self.product_id} x{self.quantity} для заказа #{self.order_id} ({self.status})"
+
+
 # ======================= #
 #        БОНУСЫ          #
 # ======================= #
 class Bonus(models.Model):
+    """
+    Текущий бонусный баланс пользователя — материализованная сумма его
+    BonusTransaction. Меняется только через shop/bonuses.py условными
+    UPDATE с F(), поэтому чтение баланса — одна строка по user.
+    """
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bonuses", verbose_name="Пользователь")
     total_bonus = models.PositiveIntegerField(default=0, verbose_name="Бонусный баланс")
 
+    class Meta:
+        constraints = [
+            # Один счёт на пользователя: иначе параллельные начисления расходятся по строкам
+            models.UniqueConstraint(fields=["user"], name="bonus_unique_user"),
+        ]
+
     def add_bonus(self, amount):
-        self.total_bonus += amount
-        self.save()
+        from .bonuses import credit  # Избегаем циклического импорта
+
+        credit(self.user_id, amount)
+        self.refresh_from_db(fields=["total_bonus"])
 
     def use_bonus(self, amount):
-        if self.total_bonus >= amount:
-            self.total_bonus -= amount
-            self.save()
-        else:
-            raise ValueError("Недостаточно бонусов")
+        from .bonuses import debit  # Избегаем циклического импорта
+
+        debit(self.user_id, amount)
+        self.refresh_from_db(fields=["total_bonus"])
 
     def __str__(self):
         return f"{self.user.username} - {self.total_bonus} бонусов"
 
 
+class BonusTransaction(models.Model):
+    """Журнал бонусов: записи только добавляются, баланс в Bonus — их сумма."""
+
+    KIND_CHOICES = [
+        ("accrual", "Начисление за заказ"),
+        ("redemption", "Списание"),
+        ("adjustment", "Корректировка"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bonus_transactions", verbose_name="Пользователь")
+    order = models.ForeignKey(
+        Order, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="bonus_transactions", verbose_name="Заказ",
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Тип операции")
+    amount = models.IntegerField(verbose_name="Сумма (со знаком)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата операции")
+
+    class Meta:
+        indexes = [
+            # История операций пользователя
+            models.Index(fields=["user", "created_at"], name="bonus_tx_user_created_idx"),
+        ]
+        constraints = [
+            # За заказ начисляют один раз, даже если пачки начисления пересеклись
+            models.UniqueConstraint(
+                fields=["order"], condition=models.Q(kind="accrual"), name="bonus_tx_unique_order_accrual",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.amount:+d} ({self.kind})"
+
+
 # ======================= #
 #        КОРЗИНА         #
 # ======================= #
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Корзина одним запросом: товар через JOIN (без описания), цена с учётом
+        скидки и сумма строки считаются в БД, итоги корзины — оконными SUM
+        по всем строкам, поэтому отдельный агрегирующий запрос не нужен.
+        """
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        unit_price = models.Case(
+            models.When(product__discount_price__gt=0, then=models.F("product__discount_price")),
+            default=models.F("product__price"),
+            output_field=money,
+        )
+        line_total = models.ExpressionWrapper(unit_price * models.F("quantity"), output_field=money)
+        return (
+            self.select_related("product")
+            .only(
+                "id", "quantity", "product_id",
+                "product__id", "product__title", "product__price", "product__discount_price", "product__image",
+            )
+            .annotate(
+                unit_price=unit_price,
+                line_total=line_total,
+                cart_subtotal=models.Window(models.Sum(line_total), output_field=money),
+                cart_item_count=models.Window(models.Sum("quantity")),
+            )
+            .order_by("id")
+        )
+
+    def add_lines(self, user, quantities):
+        """
+        Атомарно добавляет товары в корзину одним INSERT ... ON CONFLICT:
+        новая строка создаётся, у существующей количество увеличивается в БД,
+        поэтому двойное нажатие не теряет обновление. quantities — {product_id: qty}.
+        Возвращает [(id, product_id, quantity)] после изменения.
+        """
+        if not quantities:
+            return []
+        table = self.model._meta.db_table
+        rows = ", ".join(["(%s, %s, %s)"] * len(quantities))
+        params = [value for product_id, qty in quantities.items() for value in (user.pk, product_id, qty)]
+        sql = (
+            f"INSERT INTO {table} (user_id, product_id, quantity) VALUES {rows} "
+            f"ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = {table}.quantity + excluded.quantity "
+            f"RETURNING id, product_id, quantity"
+        )
+        # self.db у менеджера — алиас для чтения (реплика), а это запись
+        with connections[router.db_for_write(self.model)].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def set_lines(self, user, quantities, replace=False):
+        """
+        Устанавливает количества одним upsert; строки с количеством 0 удаляются.
+        replace=True делает корзину ровно такой, как передано (восстановление при запуске приложения).
+        """
+        keep = {product_id: qty for product_id, qty in quantities.items() if qty > 0}
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            lines = self.filter(user=user)
+            if replace:
+                lines.exclude(product_id__in=keep).delete()
+            else:
+                lines.filter(product_id__in=[pid for pid, qty in quantities.items() if qty <= 0]).delete()
+            return self.bulk_create(
+                [Cart(user=user, product_id=product_id, quantity=qty) for product_id, qty in keep.items()],
+                update_conflicts=True,
+                unique_fields=["user", "product"],
+                update_fields=["quantity"],
+            )
+
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="cart", verbose_name="Пользователь")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Товар")
     quantity = models.PositiveIntegerField(default=1, verbose_name="Количество")
 
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Одна строка на товар: количество растёт upsert'ом, а не дублями
+            models.UniqueConstraint(fields=["user", "product"], name="cart_unique_user_product"),
+        ]
+
     def clear_cart(self):
         Cart.objects.filter(user=self.user).delete()
 
@@ -137,19 +503,156 @@ class Cart(models.Model):
         return f"{self.user.username} - {self.product.title} ({self.quantity} шт.)"
 
 
+# ======================= #
+#    СВОДКИ ПРОДАЖ       #
+# ======================= #
+class SalesRollup(models.Model):
+    """
+    Продажи за день по позициям учтённых заказов (см. shop/analytics.py).
+    Строки меняются только прибавлением при оплате/доставке и вычитанием при
+    отмене, поэтому отчёты читают сводки, а не историю заказов.
+    """
+
+    day = models.DateField(verbose_name="День")
+    orders = models.IntegerField(default=0, verbose_name="Заказов")
+    units = models.IntegerField(default=0, verbose_name="Единиц товара")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка")
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+        constraints = [
+            models.UniqueConstraint(fields=["day"], name="daily_sales_unique_day"),
+        ]
+
+
+class DailyCategorySales(SalesRollup):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="daily_sales", verbose_name="Категория")
+
+    class Meta:
+        verbose_name = "Продажи категории за день"
+        verbose_name_plural = "Продажи по категориям"
+        constraints = [
+            # Ключ upsert'а; он же индекс для выборки за период
+            models.UniqueConstraint(fields=["day", "category"], name="daily_category_sales_unique"),
+        ]
+
+
+class DailyProductSales(SalesRollup):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales", verbose_name="Товар")
+
+    class Meta:
+        verbose_name = "Продажи товара за день"
+        verbose_name_plural = "Продажи по товарам"
+        constraints = [
+            models.UniqueConstraint(fields=["day", "product"], name="daily_product_sales_unique"),
+        ]
+
+
 # ======================= #
 #        ОПЛАТА          #
 # ======================= #
 class Payment(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Ожидает оплаты"),
+        ("paid", "Оплачен"),
+        ("failed", "Не прошёл"),
+        ("needs_review", "Требует проверки"),
+    ]
+
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name="payment", verbose_name="Заказ")
     method = models.CharField(max_length=50, verbose_name="Способ оплаты")
-    status = models.CharField(max_length=20, default="pending", verbose_name="Статус оплаты")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Статус оплаты")
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Сумма")
+    # Платёжная сессия в шлюзе (shop/payments.py): по ней приходит webhook и сверка
+    session_id = models.CharField(max_length=255, unique=True, null=True, blank=True, verbose_name="Сессия в шлюзе")
+    payment_url = models.URLField(max_length=1000, blank=True, verbose_name="Ссылка на оплату")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата платежа")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    class Meta:
+        indexes = [
+            # Сверка: зависшие платежи в ожидании, самые старые первыми
+            models.Index(fields=["status", "updated_at"], name="payment_status_updated_idx"),
+        ]
 
     def __str__(self):
         return f"Оплата заказа #{self.order.id} - {self.method} ({self.status})"
 
 
+# ======================= #
+#  КЛЮЧИ ИДЕМПОТЕНТНОСТИ  #
+# ======================= #
+class IdempotencyKey(models.Model):
+    """
+    Первый ответ на запрос с заголовком Idempotency-Key (см. shop/idempotency.py).
+    Пока запрос выполняется, status_code пуст; повтор с тем же ключом получает
+    сохранённый ответ, а не оформляет заказ или оплату заново.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="idempotency_keys", verbose_name="Пользователь")
+    key = models.CharField(max_length=255, verbose_name="Ключ")
+    fingerprint = models.CharField(max_length=64, verbose_name="Отпечаток запроса")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Код ответа")
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, verbose_name="Тело ответа")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    # Когда запрос взял ключ в работу: по истечении IDEMPOTENCY_IN_FLIGHT_LEASE ключ можно занять заново
+    claimed_at = models.DateTimeField(default=timezone.now, verbose_name="Взят в работу")
+    expires_at = models.DateTimeField(verbose_name="Действует до")
+
+    class Meta:
+        constraints = [
+            # Поиск повтора — один запрос по этому индексу
+            models.UniqueConstraint(fields=["user", "key"], name="idempotency_unique_user_key"),
+        ]
+        indexes = [
+            # Очистка просроченных ключей
+            models.Index(fields=["expires_at"], name="idempotency_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id}, {self.status_code or 'в работе'})"
+
+
+# ======================= #
+#  ОЧЕРЕДЬ УВЕДОМЛЕНИЙ   #
+# ======================= #
+class Notification(models.Model):
+    """Transactional outbox push-уведомлений: пишется вместе с изменением, отправляется воркером."""
+
+    STATUS_CHOICES = [
+        ("pending", "В очереди"),
+        ("sent", "Отправлено"),
+        ("skipped", "Пропущено"),
+        ("failed", "Ошибка"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications", verbose_name="Пользователь")
+    title = models.CharField(max_length=255, verbose_name="Заголовок")
+    body = models.TextField(verbose_name="Текст")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Данные")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        indexes = [
+            # Выборка очередной пачки воркером
+            models.Index(fields=["status", "next_attempt_at"], name="notification_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.title} -> {self.user_id} ({self.status})"
+
+
 # ======================= #
 #    FCM-Токены          #
 # ======================= #
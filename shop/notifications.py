@@ -0,0 +1,199 @@
+import asyncio
+from datetime import timedelta
+from functools import lru_cache
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification, UserFCMToken
+
+
+# Результат отправки, после которого повторять бессмысленно (например, у пользователя нет токена)
+SKIPPED = "skipped"
+
+
+class BaseSender:
+    """
+    Способ доставки уведомлений. ``send_batch`` получает пачку Notification и
+    возвращает {id: результат}: None — доставлено, SKIPPED — доставлять
+    некому, строка — текст ошибки (уведомление уйдёт на повтор).
+    """
+
+    def send_batch(self, notifications):
+        raise NotImplementedError
+
+
+def user_tokens(notifications):
+    """{user_id: fcm_token} для всей пачки одним запросом."""
+    return dict(
+        UserFCMToken.objects.filter(user_id__in={n.user_id for n in notifications})
+        .exclude(fcm_token="")
+        .values_list("user_id", "fcm_token")
+    )
+
+
+class FCMSender(BaseSender):
+    def send_batch(self, notifications):
+        from fcm_django.models import FCMDevice
+
+        # Токены и устройства всей пачки — двумя запросами, а не по запросу на уведомление
+        tokens = user_tokens(notifications)
+        devices = {
+            device.registration_id: device
+            for device in FCMDevice.objects.filter(registration_id__in=tokens.values())
+        }
+        missing = [FCMDevice(registration_id=token, type="android") for token in set(tokens.values()) - devices.keys()]
+        for device in FCMDevice.objects.bulk_create(missing):
+            devices[device.registration_id] = device
+
+        results = {}
+        for notification in notifications:
+            token = tokens.get(notification.user_id)
+            if not token:
+                results[notification.id] = SKIPPED
+                continue
+            try:
+                devices[token].send_message(title=notification.title, body=notification.body)
+                results[notification.id] = None
+            except Exception as e:
+                results[notification.id] = str(e) or e.__class__.__name__
+        return results
+
+
+class AsyncFCMSender(BaseSender):
+    """
+    FCM HTTP v1 через httpx.AsyncClient: уведомления пачки уходят параллельно
+    (не больше FCM_CONCURRENCY запросов одновременно), а не по одному
+    блокирующему вызову на устройство. transport и credentials подменяются в тестах.
+    """
+
+    url = "https://fcm.googleapis.com/v1/projects/{project}/messages:send"
+    scopes = ["https://www.googleapis.com/auth/firebase.messaging"]
+
+    def __init__(self, transport=None, credentials=None):
+        self.transport = transport
+        self.credentials = credentials
+
+    def access_token(self):
+        if self.credentials is None:
+            from google.oauth2 import service_account
+
+            self.credentials = service_account.Credentials.from_service_account_file(
+                settings.FIREBASE_CREDENTIALS, scopes=self.scopes,
+            )
+        if not self.credentials.valid:
+            from google.auth.transport.requests import Request
+
+            self.credentials.refresh(Request())
+        return self.credentials.token
+
+    def send_batch(self, notifications):
+        tokens = user_tokens(notifications)
+        results = {n.id: SKIPPED for n in notifications if n.user_id not in tokens}
+        pending = [n for n in notifications if n.user_id in tokens]
+        if pending:
+            results.update(async_to_sync(self.asend_batch)(pending, tokens, self.access_token()))
+        return results
+
+    async def asend_batch(self, notifications, tokens, access_token):
+        url = self.url.format(project=self.credentials.project_id)
+        limit = asyncio.Semaphore(settings.FCM_CONCURRENCY)
+        async with httpx.AsyncClient(
+            transport=self.transport, timeout=settings.FCM_TIMEOUT,
+            headers={"Authorization": f"Bearer {access_token}"},
+        ) as client:
+            async def send(notification):
+                message = {
+                    "token": tokens[notification.user_id],
+                    "notification": {"title": notification.title, "body": notification.body},
+                    "data": {key: str(value) for key, value in notification.payload.items()},
+                }
+                async with limit:
+                    try:
+                        response = await client.post(url, json={"message": message})
+                    except httpx.HTTPError as e:
+                        return notification.id, str(e) or e.__class__.__name__
+                if response.status_code == 200:
+                    return notification.id, None
+                if response.status_code == 404:
+                    # UNREGISTERED: приложение удалено, токен больше не действует
+                    return notification.id, SKIPPED
+                return notification.id, f"FCM {response.status_code}: {response.text[:200]}"
+
+            return dict(await asyncio.gather(*(send(n) for n in notifications)))
+
+
+class LocalSender(BaseSender):
+    """Заглушка для разработки и тестов: ничего не отправляет, складывает уведомления в ``outbox``."""
+
+    outbox = []
+
+    def send_batch(self, notifications):
+        self.outbox.extend(notifications)
+        return {notification.id: None for notification in notifications}
+
+
+@lru_cache(maxsize=None)
+def get_sender():
+    return import_string(settings.NOTIFICATION_SENDER)()
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.NOTIFICATION_RETRY_BASE * 2 ** (attempts - 1))
+
+
+def drain_outbox(sender=None, batch_size=100):
+    """
+    Отправляет одну пачку готовых к отправке уведомлений и возвращает её размер.
+
+    Три шага, и сеть — вне транзакции: короткой транзакцией с SKIP LOCKED пачка
+    «арендуется» сдвигом next_attempt_at на NOTIFICATION_LEASE секунд (другие
+    воркеры её не выберут), затем отправляется без блокировок в БД, затем
+    результаты записываются второй короткой транзакцией. Если воркер упал
+    посреди отправки, пачка вернётся в очередь по окончании аренды.
+    Неудачные откладываются с экспоненциальной паузой.
+    """
+    sender = sender or get_sender()
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        if not batch:
+            return 0
+        Notification.objects.filter(id__in=[n.id for n in batch]).update(
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_LEASE)
+        )
+
+    try:
+        results = sender.send_batch(batch)
+    except Exception as e:
+        results = {notification.id: str(e) or e.__class__.__name__ for notification in batch}
+
+    now = timezone.now()
+    for notification in batch:
+        outcome = results.get(notification.id, "Нет результата отправки")
+        notification.attempts += 1
+        if outcome is None:
+            notification.status = "sent"
+            notification.sent_at = now
+        elif outcome == SKIPPED:
+            notification.status = "skipped"
+        else:
+            notification.last_error = outcome
+            if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                notification.status = "failed"
+            else:
+                notification.next_attempt_at = now + retry_delay(notification.attempts)
+
+    with transaction.atomic():
+        Notification.objects.bulk_update(
+            batch, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+        )
+    return len(batch)
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import hmac
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .inventory import InsufficientStock, commit_order_stock
+from .models import Payment
+
+
+# Ответ шлюза на создание сессии: id для webhook/сверки и ссылка, куда отправить покупателя
+PaymentSession = namedtuple("PaymentSession", ["id", "url"])
+
+# Статусы сессии, которые возвращает шлюз
+PENDING, PAID, FAILED = "pending", "paid", "failed"
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class BaseGateway:
+    """
+    Платёжный шлюз. Все обращения к банку асинхронные: сессия создаётся из
+    async-view, статусы для сверки запрашиваются пачкой параллельно, поэтому
+    поток обработки запросов не ждёт банк.
+    """
+
+    async def acreate_session(self, payment):
+        """-> PaymentSession; при недоступности банка — PaymentGatewayError."""
+        raise NotImplementedError
+
+    async def afetch_status(self, session_id):
+        """-> PENDING / PAID / FAILED."""
+        raise NotImplementedError
+
+    async def afetch_statuses(self, session_ids):
+        """{session_id: статус}; сессии, по которым банк не ответил, в результат не попадают."""
+        limit = asyncio.Semaphore(settings.PAYMENT_GATEWAY_CONCURRENCY)
+
+        async def fetch(session_id):
+            async with limit:
+                try:
+                    return session_id, await self.afetch_status(session_id)
+                except PaymentGatewayError:
+                    return session_id, None
+
+        results = await asyncio.gather(*(fetch(session_id) for session_id in session_ids))
+        return {session_id: result for session_id, result in results if result is not None}
+
+
+class HTTPGateway(BaseGateway):
+    """
+    Шлюз банка по HTTP: POST {PAYMENT_GATEWAY_URL}/sessions создаёт сессию
+    ({"id", "url"}), GET /sessions/<id> возвращает {"status"}. transport
+    подменяется в тестах.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport
+
+    def client(self):
+        return httpx.AsyncClient(
+            base_url=settings.PAYMENT_GATEWAY_URL,
+            transport=self.transport,
+            timeout=settings.PAYMENT_GATEWAY_TIMEOUT,
+            headers={"Authorization": f"Bearer {settings.PAYMENT_GATEWAY_TOKEN}"},
+        )
+
+    async def request(self, method, url, **kwargs):
+        async with self.client() as client:
+            try:
+                response = await client.request(method, url, **kwargs)
+                response.raise_for_status()
+                return response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                raise PaymentGatewayError(str(e) or e.__class__.__name__) from e
+
+    async def acreate_session(self, payment):
+        data = await self.request("POST", "/sessions", json={
+            "reference": str(payment.id),
+            "amount": str(payment.amount),
+            "currency": settings.PAYMENT_CURRENCY,
+            "method": payment.method,
+        })
+        return PaymentSession(data["id"], data["url"])
+
+    async def afetch_status(self, session_id):
+        data = await self.request("GET", f"/sessions/{session_id}")
+        return data.get("status", PENDING)
+
+
+class FakeGateway(BaseGateway):
+    """
+    Шлюз для разработки и тестов: ничего не отправляет, сессии живут в
+    ``sessions`` ({session_id: статус}); «оплатить» — поменять там статус.
+    """
+
+    sessions = {}
+
+    async def acreate_session(self, payment):
+        session_id = f"fake_{uuid.uuid4().hex}"
+        self.sessions[session_id] = PENDING
+        return PaymentSession(session_id, f"https://pay.example/fake/{session_id}")
+
+    async def afetch_status(self, session_id):
+        return self.sessions.get(session_id, PENDING)
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    return import_string(settings.PAYMENT_GATEWAY)()
+
+
+def sign_payload(body):
+    return hmac.new(settings.PAYMENT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body, signature):
+    # Без настроенного секрета подпись проверить нечем — такой webhook не принимаем
+    if not settings.PAYMENT_WEBHOOK_SECRET or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(body), signature)
+
+
+@transaction.atomic
+def apply_payment_result(session_id, result):
+    """
+    Применяет итог сессии из webhook или сверки. Повторы безопасны: решение
+    принимается один раз, пока платёж в ожидании, под блокировкой строки.
+    Оплаченный заказ получает статус paid со списанием резерва; если заказ
+    уже не ждёт оплаты или товара не хватило — платёж уходит на ручную проверку.
+    Возвращает платёж или None, если сессия неизвестна.
+    """
+    payment = (
+        Payment.objects.select_for_update().select_related("order")
+        .filter(session_id=session_id).first()
+    )
+    if payment is None or payment.status != "pending" or result not in (PAID, FAILED):
+        return payment
+
+    if result == FAILED:
+        payment.status = "failed"
+    elif payment.order.status != "pending":
+        payment.status = "needs_review"
+    else:
+        try:
+            with transaction.atomic():
+                commit_order_stock(payment.order)
+                payment.order.status = "paid"
+                payment.order.save()
+            payment.status = "paid"
+        except InsufficientStock:
+            payment.status = "needs_review"
+    payment.save(update_fields=["status", "updated_at"])
+    return payment
+
+
+def reconcile_payments(gateway=None, batch_size=100, now=None):
+    """
+    Сверяет одну пачку зависших платежей: в ожидании дольше
+    PAYMENT_RECONCILE_AFTER секунд (webhook не пришёл). Пачка сначала
+    «арендуется» сдвигом updated_at, затем статусы запрашиваются у шлюза
+    параллельно вне транзакции. Возвращает размер пачки.
+    """
+    gateway = gateway or get_gateway()
+    now = now or timezone.now()
+    stale = Payment.objects.filter(
+        status="pending", session_id__isnull=False,
+        updated_at__lte=now - timedelta(seconds=settings.PAYMENT_RECONCILE_AFTER),
+    )
+    batch = list(stale.order_by("updated_at").values_list("id", "session_id")[:batch_size])
+    if not batch:
+        return 0
+    # Другой воркер эту пачку уже не выберет, а оставшиеся в ожидании вернутся через PAYMENT_RECONCILE_AFTER
+    Payment.objects.filter(id__in=[payment_id for payment_id, _ in batch]).update(updated_at=now)
+
+    statuses = async_to_sync(gateway.afetch_statuses)([session_id for _, session_id in batch])
+    for session_id, result in statuses.items():
+        apply_payment_result(session_id, result)
+    return len(batch)
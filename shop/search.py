@@ -0,0 +1,145 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+FTS_TABLE = "shop_product_fts"
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class BaseSearchBackend:
+    """
+    Полнотекстовый поиск по названию и описанию товара.
+
+    ``search()`` сужает выборку товаров до совпадений и добавляет аннотацию
+    ``search_rank`` (чем меньше, тем релевантнее), по которой работает
+    курсорная пагинация. ``index_products``/``remove_products`` вызываются
+    при каждом изменении товара, поэтому индекс обновляется по одной записи.
+    """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """FTS5-таблица shop_product_fts (rowid = id товара), ранжирование bm25."""
+
+    # Вес совпадения в названии выше, чем в описании
+    rank_sql = f"bm25({FTS_TABLE}, 10.0, 1.0)"
+
+    def build_match(self, query):
+        # Экранируем пользовательский ввод: каждое слово — префиксный поиск, все слова обязательны
+        tokens = TOKEN_RE.findall(query)
+        return " ".join(f'"{token}"*' for token in tokens)
+
+    def search(self, queryset, query):
+        match = self.build_match(query)
+        if not match:
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        table = queryset.model._meta.db_table
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT {self.rank_sql} FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id",
+                (match,),
+                output_field=FloatField(),
+            )
+        )
+
+    def index_products(self, products):
+        rows = [(p.pk, p.title, p.description) for p in products if p.pk is not None]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)", rows
+            )
+
+    def remove_products(self, product_ids):
+        product_ids = [(pk,) for pk in product_ids]
+        if product_ids:
+            with connection.cursor() as cursor:
+                cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", product_ids)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    tsvector-поиск для продакшена. Индекс — GIN по выражению (см. миграцию
+    0007), его поддерживает сама БД, поэтому index/remove ничего не делают.
+    """
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        config = settings.PRODUCT_SEARCH_CONFIG
+        vector = SearchVector("title", "description", config=config)
+        search_query = SearchQuery(query, config=config, search_type="websearch")
+        return queryset.annotate(
+            search_vector=vector,
+            search_rank=-SearchRank(vector, search_query),
+        ).filter(search_vector=search_query)
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = settings.PRODUCT_SEARCH_BACKEND
+    if not path:
+        path = (
+            "shop.search.PostgresSearchBackend"
+            if connection.vendor == "postgresql"
+            else "shop.search.SQLiteFTSBackend"
+        )
+    return import_string(path)()
+
+
+def price_bucket_label(lower, upper):
+    return f"{lower}-{upper}" if upper is not None else f"{lower}+"
+
+
+def get_search_facets(queryset):
+    """
+    Фасеты по категориям и ценовым диапазонам одним агрегирующим запросом:
+    GROUP BY категории с условными COUNT для каждого диапазона цен.
+    """
+    bounds = list(settings.SEARCH_PRICE_BUCKETS)
+    buckets = []
+    for index, lower in enumerate(bounds):
+        upper = bounds[index + 1] if index + 1 < len(bounds) else None
+        condition = Q(price__gte=lower) if upper is None else Q(price__gte=lower, price__lt=upper)
+        buckets.append((f"bucket_{index}", price_bucket_label(lower, upper), condition))
+
+    rows = (
+        queryset.order_by()
+        .values("category_id", "category__name")
+        .annotate(
+            count=Count("id"),
+            **{alias: Count("id", filter=condition) for alias, _, condition in buckets},
+        )
+        .order_by("-count", "category__name")
+    )
+
+    categories = []
+    price_counts = {alias: 0 for alias, _, _ in buckets}
+    for row in rows:
+        categories.append({"id": row["category_id"], "name": row["category__name"], "count": row["count"]})
+        for alias in price_counts:
+            price_counts[alias] += row[alias]
+
+    return {
+        "categories": categories,
+        "price": [{"range": label, "count": price_counts[alias]} for alias, label, _ in buckets],
+    }
@@ -1,20 +1,193 @@
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Product, Order, OrderItem, Bonus, Cart
+from .models import Category, Product, Order, OrderItem, Bonus, Cart
+
+
+class CategoryNameField(serializers.SlugRelatedField):
+    """
+    Категория в API остаётся строкой. Валидация в БД не пишет: для нового
+    имени возвращается несохранённая Category, создаёт её ProductSerializer
+    при сохранении товара.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("slug_field", "name")
+        kwargs.setdefault("queryset", Category.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data.strip():
+            self.fail("invalid")
+        name = data.strip()
+        return self.get_queryset().filter(name=name).first() or Category(name=name)
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии фото: {"thumb": url, "card": url, "full": url}."""
+
+    def __init__(self, **kwargs):
+        kwargs.update(source="*", read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, product):
+        if not product.image:
+            return None
+        request = self.context.get("request")
+        urls = {}
+        for variant in settings.PRODUCT_IMAGE_VARIANTS:
+            url = reverse("product_image_variant", kwargs={"pk": product.pk, "variant": variant})
+            urls[variant] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name']
+
+
+class SparseFieldsMixin:
+    """
+    Разреженный набор полей: если в context["fields"] передан список имён,
+    остальные поля сериализатора отбрасываются. query_columns() возвращает
+    колонки для .only(), чтобы не читать из БД то, что не попадёт в ответ.
+    """
+
+    # Поле сериализатора -> колонки модели, если они не совпадают с именем поля
+    column_map = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get("fields")
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def parse_fields(cls, raw):
+        """"id,title,price" -> ["id", "title", "price"]; None, если параметр пуст."""
+        names = [name.strip() for name in (raw or "").split(",") if name.strip()]
+        if not names:
+            return None
+        unknown = set(names) - set(cls().fields)
+        if unknown:
+            raise serializers.ValidationError({"fields": f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+        return names
+
+    @classmethod
+    def query_columns(cls, fields):
+        columns = {"id"}
+        for name in fields:
+            columns.update(cls.column_map.get(name, [name]))
+        return columns
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    category = CategoryNameField()
+    image_variants = ImageVariantsField()
+
+    column_map = {
+        "category": ["category", "category__name"],
+        "image_variants": ["image"],
+    }
 
-class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
 
+    def save_category(self, validated_data):
+        category = validated_data.get("category")
+        if category is not None and category.pk is None:
+            validated_data["category"], _ = Category.objects.get_or_create(name=category.name)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        self.save_category(validated_data)
+        return super().create(validated_data)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        self.save_category(validated_data)
+        return super().update(instance, validated_data)
+
+
+class ProductListSerializer(ProductSerializer):
+    """Компактная карточка для списков: без описания и служебных полей."""
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['id', 'title', 'price', 'discount_price', 'category', 'stock', 'image', 'image_variants']
+
+
+class ProductSummarySerializer(serializers.ModelSerializer):
+    """Краткая карточка товара для корзины — без описания."""
+
+    image_variants = ImageVariantsField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'title', 'price', 'discount_price', 'image', 'image_variants']
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product = ProductSummarySerializer(read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'quantity']
+
+
 class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+
     class Meta:
         model = Order
-        fields = '__all__'
+        exclude = ['sales_recorded']
+        # Сумма и статус задаются оформлением и персоналом, не покупателем
+        read_only_fields = ['user', 'status', 'total_price']
 
 class BonusSerializer(serializers.ModelSerializer):
     class Meta:
         model = Bonus
         fields = '__all__'
+        # Баланс меняется только операциями журнала (shop/bonuses.py)
+        read_only_fields = ['total_bonus']
+
+class CartLineSerializer(serializers.ModelSerializer):
+    product = ProductSummarySerializer(read_only=True)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'product', 'quantity', 'unit_price', 'line_total']
+
+
+class CartLineInputSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """{"mode": "add" | "set", "replace": bool, "items": [{"product_id", "quantity"}, ...]}"""
+
+    mode = serializers.ChoiceField(choices=["add", "set"], default="add")
+    replace = serializers.BooleanField(default=False)
+    items = CartLineInputSerializer(many=True, allow_empty=True, max_length=500)
+
+    def validate(self, attrs):
+        if attrs["replace"] and attrs["mode"] != "set":
+            raise serializers.ValidationError({"replace": "replace допустим только с mode=set"})
+        quantities = {}
+        for item in attrs["items"]:
+            if attrs["mode"] == "add":
+                quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+            else:
+                quantities[item["product_id"]] = item["quantity"]
+        attrs["quantities"] = quantities
+        return attrs
+
 
 class CartSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)  # Подтягиваем данные о товаре
@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import invalidate_cached_user
+from .cache import invalidate_catalog
+from .images import schedule_variants
+from .models import Category, Product
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def touch_category(sender, instance, **kwargs):
+    # Удалённый товар не оставляет updated_at — сдвигаем водяной знак каталога через категорию
+    Category.objects.filter(pk=instance.category_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def build_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: schedule_variants(name))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Ещё раз после коммита: параллельный запрос мог успеть закэшировать старую строку
+    invalidate_cached_user(instance.pk)
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
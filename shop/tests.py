@@ -1,3 +1,1447 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import httpx
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from zahroshop.routers import PrimaryReplicaRouter, ReplicaPinningMiddleware
+
+from .analytics import rebuild_sales
+from .bonuses import InsufficientBonus, accrue_delivered_orders, credit, debit, get_balance
+from .cache import CATALOG_VERSION_KEY, NONE_MARKER, catalog_cache
+from .checkout import place_order
+from .conditional import catalog_watermark
+from .idempotency import purge_expired_keys
+from .images import variant_path
+from .inventory import commit_order_stock, release_expired_reservations
+from .models import (
+    Bonus, BonusTransaction, Cart, Category, DailyCategorySales, DailyProductSales, DailySales, IdempotencyKey,
+    Notification, Order, OrderItem, Payment, Product, StockReservation, UserFCMToken,
+)
+from .notifications import SKIPPED, AsyncFCMSender, LocalSender, drain_outbox
+from .pagination import KeysetPagination
+from .payments import FakeGateway, HTTPGateway, PaymentGatewayError, reconcile_payments, sign_payload
+from .search import get_search_backend
+
+
+def clear_catalog_cache():
+    # Версия каталога живёт в общем кэше — LRU процесса и запомненную версию чистим тоже
+    cache.clear()
+    catalog_cache.local.clear()
+    catalog_cache._version = None
+
+
+class CreateOrderViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Товары")
+
+    def fill_cart(self, size):
+        for i in range(size):
+            product = Product.objects.create(
+                title=f"Товар {i}", price=100, discount_price=80 if i % 2 else None,
+                category=self.category, stock=10,
+            )
+            Cart.objects.create(user=self.user, product=product, quantity=2)
+
+    def checkout_queries(self, size):
+        self.fill_cart(size)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/order/create/")
+        self.assertEqual(response.status_code, 201)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        small = self.checkout_queries(1)
+        Order.objects.all().delete()
+        large = self.checkout_queries(25)
+        self.assertEqual(small, large)
+
+    def test_checkout_builds_order_and_clears_cart(self):
+        self.fill_cart(3)
+        response = self.client.post("/api/order/create/")
+
+        order = Order.objects.get(pk=response.data["order_id"])
+        self.assertEqual(order.total_price, 2 * (100 + 80 + 100))
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        self.assertEqual(set(Product.objects.values_list("stock", flat=True)), {8})
+
+    def test_empty_cart(self):
+        response = self.client.post("/api/order/create/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_place_order_query_budget(self):
+        self.fill_cart(10)
+        # SAVEPOINT, чтение корзины с товарами, INSERT заказа, bulk INSERT позиций,
+        # условный UPDATE остатков, bulk INSERT резервов, DELETE корзины, RELEASE
+        with self.assertNumQueries(8):
+            place_order(self.user)
+
+    def test_insufficient_stock_rolls_back_whole_order(self):
+        self.fill_cart(3)
+        Product.objects.filter(title="Товар 2").update_stock(1)
+
+        response = self.client.post("/api/order/create/")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(sorted(Product.objects.values_list("stock", flat=True)), [1, 10, 10])
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 3)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        category = Category.objects.create(name="Товары")
+        self.product = Product.objects.create(title="Товар", price=100, category=category, stock=5)
+        Cart.objects.create(user=self.user, product=self.product, quantity=2)
+        self.order = place_order(self.user)
+
+    def test_expired_reservation_is_released(self):
+        release_expired_reservations(now=timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL + 1))
+
+        self.product.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(self.order.status, "cancelled")
+        self.assertEqual(
+            list(Notification.objects.values_list("payload", flat=True)),
+            [{"order_id": self.order.id, "status": "cancelled"}],
+        )
+
+    def test_commit_keeps_stock_reserved(self):
+        commit_order_stock(self.order)
+        release_expired_reservations(now=timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL + 1))
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_cancelling_paid_order_returns_stock(self):
+        Cart.objects.create(user=self.user, product=self.product, quantity=1)
+        other = place_order(self.user)
+        for order in (self.order, other):
+            commit_order_stock(order)
+            Order.objects.filter(id=order.id).transition_to("paid")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+        Order.objects.filter(id=self.order.id).transition_to("cancelled")
+        other = Order.objects.get(id=other.id)
+        other.status = "cancelled"
+        other.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(set(StockReservation.objects.values_list("status", flat=True)), {"released"})
+
+    def test_leaving_pending_commits_reservation(self):
+        Cart.objects.create(user=self.user, product=self.product, quantity=1)
+        other = place_order(self.user)
+
+        Order.objects.filter(id=self.order.id).transition_to("shipped")
+        other.status = "processing"
+        other.save()
+        release_expired_reservations(now=timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL + 1))
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertEqual(set(StockReservation.objects.values_list("status", flat=True)), {"committed"})
+        self.assertEqual(Order.objects.get(id=self.order.id).status, "shipped")
+
+
+class OrderDirtyFieldsTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="buyer", password="pass")
+        self.order = Order.objects.create(user=user, address="Душанбе", total_price=100)
+
+    def test_save_writes_only_changed_columns_without_select(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.address = "Худжанд"
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]["sql"]
+        self.assertTrue(sql.startswith("UPDATE"))
+        self.assertIn('"address"', sql)
+        self.assertNotIn('"total_price"', sql)
+
+    def test_unchanged_save_is_noop(self):
+        order = Order.objects.get(pk=self.order.pk)
+        with self.assertNumQueries(0):
+            order.save()
+
+    def test_status_change_fires_hook(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = "processing"
+        with mock.patch.object(Order, "send_order_update_notification") as notify:
+            order.save()
+            order.save()
+        notify.assert_called_once_with()
+        self.assertEqual(Order.objects.get(pk=order.pk).status, "processing")
+
+    def test_assigned_deferred_field_is_saved(self):
+        order = Order.objects.only("id", "status").get(pk=self.order.pk)
+        order.address = "Худжанд"
+        order.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).address, "Худжанд")
+
+    def test_reading_deferred_field_keeps_pending_edit(self):
+        order = Order.objects.only("id", "status").get(pk=self.order.pk)
+        order.status = "processing"
+        self.assertEqual(order.address, "Душанбе")  # догружает отложенное поле
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).status, "processing")
+        self.assertTrue(Notification.objects.filter(payload__order_id=order.pk).exists())
+
+    def test_partial_save_keeps_other_edits_dirty(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.address = "Худжанд"
+        order.phone = "+992"
+        order.save(update_fields=["phone"])
+        self.assertEqual(list(order.get_dirty_fields()), ["address"])
+        order.save()
+        self.assertEqual(Order.objects.values_list("address", "phone").get(pk=order.pk), ("Худжанд", "+992"))
+
+
+@override_settings(NOTIFICATION_SENDER="shop.notifications.LocalSender")
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.order = Order.objects.create(user=self.user, address="Душанбе", total_price=100)
+        LocalSender.outbox.clear()
+
+    def test_status_change_is_queued_and_sent_by_worker(self):
+        self.order.status = "shipped"
+        self.order.save()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.payload, {"order_id": self.order.id, "status": "shipped"})
+        self.assertEqual(LocalSender.outbox, [])
+
+        self.assertEqual(drain_outbox(sender=LocalSender()), 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, "sent")
+        self.assertEqual(len(LocalSender.outbox), 1)
+
+    def test_failed_send_is_retried_with_backoff(self):
+        self.order.status = "shipped"
+        self.order.save()
+        sender = mock.Mock()
+        sender.send_batch.side_effect = lambda batch: {n.id: "timeout" for n in batch}
+
+        drain_outbox(sender=sender)
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ("pending", 1))
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        self.assertEqual(drain_outbox(sender=sender), 0)
+
+    def test_send_happens_outside_transaction_on_leased_batch(self):
+        self.order.status = "shipped"
+        self.order.save()
+        seen = {}
+
+        def send_batch(batch):
+            seen["atomic_depth"] = len(connection.atomic_blocks)
+            # Пока пачка отправляется, другой воркер её не выберет
+            seen["second_worker"] = drain_outbox(sender=LocalSender())
+            return {n.id: None for n in batch}
+
+        sender = mock.Mock()
+        sender.send_batch.side_effect = send_batch
+        depth = len(connection.atomic_blocks)  # транзакции самого TestCase
+        self.assertEqual(drain_outbox(sender=sender), 1)
+        self.assertEqual(seen, {"atomic_depth": depth, "second_worker": 0})
+        self.assertEqual(Notification.objects.get().status, "sent")
+
+
+class BulkOrderStatusTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def test_valid_transitions_applied_in_one_update(self):
+        orders = [Order.objects.create(user=self.user, address="Душанбе") for _ in range(20)]
+        delivered = Order.objects.create(user=self.user, address="Душанбе", status="delivered")
+        ids = [order.id for order in orders] + [delivered.id, 999999]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/orders/bulk-status/", {"order_ids": ids, "status": "shipped"}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["skipped"], [delivered.id, 999999])
+        self.assertEqual(Order.objects.filter(status="shipped").count(), 20)
+        self.assertEqual(Notification.objects.count(), 20)
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "shop_order"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_unknown_status_rejected(self):
+        order = Order.objects.create(user=self.user, address="Душанбе")
+        response = self.client.post("/api/orders/bulk-status/", {"order_ids": [order.id], "status": "lost"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class CartViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Товары")
+
+    def fill_cart(self, size):
+        for i in range(size):
+            product = Product.objects.create(
+                title=f"Товар {i}", price=100, discount_price=80 if i % 2 else None, category=self.category,
+            )
+            Cart.objects.create(user=self.user, product=product, quantity=2)
+
+    def test_cart_stays_a_list_of_lines(self):
+        self.fill_cart(2)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/cart/")
+        lines = response.json()
+        self.assertIsInstance(lines, list)
+        self.assertEqual([set(line) for line in lines], [{"id", "user", "product", "quantity"}] * 2)
+        self.assertEqual(lines[0]["product"]["title"], "Товар 0")
+        self.assertEqual(lines[0]["product"]["category"], "Товары")
+        self.assertEqual(lines[0]["quantity"], 2)
+
+        self.fill_cart(10)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get("/api/cart/").json()), 12)
+
+    def test_summary_has_totals(self):
+        self.fill_cart(3)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/cart/summary/")
+        data = response.json()
+        self.assertEqual(len(data["items"]), 3)
+        self.assertEqual(data["subtotal"], "560.00")
+        self.assertEqual(data["item_count"], 6)
+
+
+class CartUpsertTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Товары")
+        self.products = [Product.objects.create(title=f"Товар {i}", price=10, category=category) for i in range(3)]
+
+    def test_repeated_add_increments_single_line(self):
+        product = self.products[0]
+        for _ in range(2):
+            response = self.client.post("/api/cart/add/", {"product_id": product.id, "quantity": 2}, format="json")
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(response.data["quantity"], 4)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(response.data["product"]["id"], product.id)
+        self.assertEqual(response.data["user"], self.user.id)
+
+    def test_add_lines_writes_to_primary(self):
+        with mock.patch("shop.models.router.db_for_write", return_value="default") as db_for_write:
+            Cart.objects.add_lines(self.user, {self.products[0].id: 1})
+        db_for_write.assert_called_once_with(Cart)
+
+    def test_add_unknown_product(self):
+        response = self.client.post("/api/cart/add/", {"product_id": 999999}, format="json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_set_with_replace_restores_cart(self):
+        Cart.objects.create(user=self.user, product=self.products[0], quantity=5)
+        items = [
+            {"product_id": self.products[1].id, "quantity": 2},
+            {"product_id": self.products[2].id, "quantity": 1},
+        ]
+        response = self.client.post("/api/cart/batch/", {"mode": "set", "replace": True, "items": items}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(Cart.objects.filter(user=self.user).values_list("product_id", "quantity")),
+            {self.products[1].id: 2, self.products[2].id: 1},
+        )
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Товары")
+        product = Product.objects.create(title="Товар", price=10, category=category)
+        for _ in range(30):
+            order = Order.objects.create(user=self.user, address="Душанбе")
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=1) for _ in range(3)])
+        other = User.objects.create_user(username="other", password="pass")
+        Order.objects.create(user=other, address="Худжанд")
+
+    def test_history_is_scoped_paginated_and_prefetched(self):
+        seen = []
+        url = "/api/api/orders/?page_size=20"
+        while url:
+            # заказы страницы + позиции с товарами
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            seen += [order["id"] for order in response.data["results"]]
+            self.assertTrue(all(len(order["items"]) == 3 for order in response.data["results"]))
+            url = response.data["next"]
+
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(set(seen), set(Order.objects.filter(user=self.user).values_list("id", flat=True)))
+
+    def test_history_is_read_only(self):
+        order = Order.objects.filter(user=self.user).first()
+        response = self.client.patch(
+            f"/api/api/orders/{order.id}/", {"status": "delivered", "total_price": 100000}, format="json",
+        )
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(self.client.post("/api/api/orders/", {"address": "Душанбе"}, format="json").status_code, 405)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.total_price), ("pending", 0))
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="buyer", password="pass")
+        admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        category = Category.objects.create(name="Товары")
+        product = Product.objects.create(title="Товар", price=10, category=category)
+        for status_ in ("pending", "delivered", "delivered"):
+            order = Order.objects.create(user=user, address="Душанбе", status=status_)
+            OrderItem.objects.create(order=order, product=product, quantity=2)
+
+    def test_streams_filtered_ndjson(self):
+        response = self.client.get("/api/orders/export/", {"dataset": "items", "output": "ndjson", "status": "delivered"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["order__status"], "delivered")
+
+    def test_csv_has_header(self):
+        response = self.client.get("/api/orders/export/", {"date_from": "2000-01-01"})
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ["id", "created_at", "status"])
+        self.assertEqual(len(rows), 4)
+
+    def test_bad_date(self):
+        response = self.client.get("/api/orders/export/", {"date_from": "вчера"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportProductsCommandTests(TestCase):
+    def write_csv(self, rows, fieldnames=("sku", "title", "price", "category", "stock")):
+        handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8", newline="")
+        with handle:
+            writer = csv.DictWriter(handle, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_upserts_by_sku_in_batches_and_invalidates_once(self):
+        rows = [{"sku": f"SKU-{i}", "title": f"Товар {i}", "price": "10.00", "category": f"Кат {i % 3}", "stock": 5}
+                for i in range(25)]
+        call_command("import_products", self.write_csv(rows), batch_size=10, stdout=io.StringIO())
+
+        rows[0]["price"] = "12.50"
+        rows.append({"sku": "", "title": "Без артикула", "price": "1", "category": "Кат 0", "stock": 1})
+        with mock.patch("shop.cache.catalog_cache.bump_version") as bump, \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command("import_products", self.write_csv(rows), batch_size=10, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(Product.objects.count(), 25)
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(str(Product.objects.get(sku="SKU-0").price), "12.50")
+        bump.assert_called_once_with()
+
+    def test_products_without_sku_round_trip_by_id(self):
+        category = Category.objects.create(name="Кат")
+        old = Product.objects.create(title="Старый", price=10, category=category, stock=1)
+        other = Product.objects.create(title="Второй", price=20, category=category, stock=2)
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir)
+        export_path = os.path.join(export_dir, "products.csv")
+        call_command("export_products", output=export_path)
+
+        with open(export_path, encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([(row["id"], row["sku"]) for row in rows], [(str(old.id), ""), (str(other.id), "")])
+        rows[0]["price"] = "15.00"
+        rows[1]["sku"] = "SKU-2"
+        rows.append({**rows[0], "id": "999999"})
+        path = self.write_csv(rows, fieldnames=list(rows[0]))
+        err = io.StringIO()
+        call_command("import_products", path, stdout=io.StringIO(), stderr=err)
+
+        self.assertEqual(Product.objects.count(), 2)
+        old.refresh_from_db()
+        self.assertEqual((str(old.price), old.sku), ("15.00", None))
+        self.assertEqual(Product.objects.get(sku="SKU-2").id, other.id)
+        self.assertIn("999999", err.getvalue())
+
+
+class ProductImageVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media, PRODUCT_IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        clear_catalog_cache()
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), "red").save(buffer, "JPEG")
+        category = Category.objects.create(name="Товары")
+        self.product = Product.objects.create(
+            title="Товар", price=10, category=category,
+            image=SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg"),
+        )
+
+    def test_variant_generated_lazily_and_exposed_in_serializer(self):
+        response = self.client.get(f"/api/products/{self.product.pk}/")
+        thumb_url = response.json()["image_variants"]["thumb"]
+
+        response = self.client.get(thumb_url)
+        self.assertEqual(response.status_code, 302)
+        path = variant_path(self.product.image.name, "thumb")
+        with default_storage.open(path) as f, Image.open(f) as thumb:
+            self.assertEqual(thumb.size, (160, 80))
+
+    def test_unknown_variant(self):
+        response = self.client.get(f"/api/products/{self.product.pk}/image/huge/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_variant_path_keeps_source_extension(self):
+        self.assertNotEqual(variant_path("products/photo.jpg", "thumb"), variant_path("products/photo.png", "thumb"))
+
+    def test_missing_or_broken_source_is_not_found(self):
+        default_storage.delete(self.product.image.name)
+        response = self.client.get(f"/api/products/{self.product.pk}/image/thumb/")
+        self.assertEqual(response.status_code, 404)
+
+        broken = Product.objects.create(
+            title="Битый", price=10, category=self.product.category,
+            image=SimpleUploadedFile("broken.jpg", b"not an image", content_type="image/jpeg"),
+        )
+        response = self.client.get(f"/api/products/{broken.pk}/image/thumb/")
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductFilterTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.flowers = Category.objects.create(name="Цветы")
+        gifts = Category.objects.create(name="Подарки")
+        self.rose = Product.objects.create(title="Роза", price=50, stock=3, category=self.flowers)
+        self.tulip = Product.objects.create(title="Тюльпан", price=150, stock=0, category=self.flowers)
+        self.card = Product.objects.create(title="Открытка", price=500, stock=1, category=gifts)
+
+    def ids(self, **params):
+        response = self.client.get("/api/products/", params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(item["id"] for item in response.json()["results"])
+
+    def test_filters(self):
+        flowers = sorted([self.rose.id, self.tulip.id])
+        self.assertEqual(self.ids(category=self.flowers.id), flowers)
+        self.assertEqual(self.ids(category="Цветы"), flowers)
+        self.assertEqual(self.ids(category="Нет такой"), [])
+        self.assertEqual(self.ids(min_price="100"), sorted([self.tulip.id, self.card.id]))
+        self.assertEqual(self.ids(max_price="150"), flowers)
+        self.assertEqual(self.ids(min_price="100", max_price="150"), [self.tulip.id])
+        self.assertEqual(self.ids(in_stock="1"), sorted([self.rose.id, self.card.id]))
+        self.assertEqual(self.ids(in_stock="0"), sorted([self.rose.id, self.tulip.id, self.card.id]))
+        self.assertEqual(self.ids(category="Цветы", in_stock="true"), [self.rose.id])
+
+    def test_invalid_values(self):
+        for params in [{"min_price": "дёшево"}, {"max_price": "1,5"}, {"ordering": "title"}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/api/products/", params).status_code, 400)
+
+    def test_category_created_only_with_valid_product(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="admin", is_staff=True))
+
+        response = client.post("/api/products/", {"title": "Ваза", "price": "abc", "category": "Посуда"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Category.objects.filter(name="Посуда").exists())
+
+        response = client.post("/api/products/", {"title": "Ваза", "price": "90", "category": " Посуда "}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.get(title="Ваза").category.name, "Посуда")
+
+        response = client.post("/api/products/", {"title": "Пион", "price": "90", "category": "Цветы"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Category.objects.filter(name="Цветы").count(), 1)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        category = Category.objects.create(name="Товары")
+        self.products = [Product.objects.create(title=f"Товар {i}", price=10, category=category) for i in range(7)]
+        # Несколько товаров с одинаковым created_at: порядок внутри группы решает id
+        same = timezone.now() - timedelta(days=1)
+        Product.objects.filter(id__in=[p.id for p in self.products[1:5]]).update(created_at=same)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item["id"] for item in response.json()["results"]]
+            url = response.json()["next"]
+        return ids
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        expected = list(Product.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(self.walk("/api/products/?page_size=2"), expected)
+        expected = list(Product.objects.order_by("price", "id").values_list("id", flat=True))
+        self.assertEqual(self.walk("/api/products/?page_size=3&ordering=price"), expected)
+
+    def test_invalid_cursor(self):
+        for cursor in ["!!!", "W10", "WyJ4Il0"]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f"/api/products/?cursor={cursor}").status_code, 404)
+
+    @override_settings(API_PAGE_SIZE=2, API_MAX_PAGE_SIZE=5)
+    def test_page_size_is_clamped(self):
+        for page_size, expected in [("100", 5), ("0", 1), ("-3", 1), ("abc", 2), ("", 2)]:
+            with self.subTest(page_size=page_size):
+                response = self.client.get("/api/products/", {"page_size": page_size})
+                self.assertEqual(len(response.json()["results"]), expected)
+
+    def test_deep_page_seeks_index(self):
+        paginator = KeysetPagination()
+        paginator.ordering = ("-created_at", "-id")
+        last = self.products[3]
+        queryset = Product.objects.order_by(*paginator.ordering).filter(
+            paginator.build_keyset_filter([last.created_at, last.id])
+        )
+        plan = queryset.explain()
+        self.assertIn("SEARCH", plan)
+        self.assertNotIn("SCAN", plan)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        flowers = Category.objects.create(name="Цветы")
+        gifts = Category.objects.create(name="Подарки")
+        self.rose = Product.objects.create(title="Роза красная", price=50, category=flowers)
+        self.bouquet = Product.objects.create(
+            title="Букет", description="Пионы и роза в крафте", price=150, category=flowers,
+        )
+        self.card = Product.objects.create(title="Открытка с розами", price=600, category=gifts)
+
+    def search_ids(self, query):
+        found = get_search_backend().search(Product.objects.all(), query)
+        return list(found.order_by("search_rank", "id").values_list("id", flat=True))
+
+    def test_title_match_ranks_above_description(self):
+        # Префиксный поиск: «роза» находит и «розами»; совпадения в названии выше, чем в описании
+        response = self.client.get("/api/products/search/?q=роза")
+        self.assertEqual(
+            [item["id"] for item in response.json()["results"]], [self.rose.id, self.card.id, self.bouquet.id],
+        )
+
+    def test_facets_count_categories_and_price_ranges(self):
+        facets = self.client.get("/api/products/search/?q=роз").json()["facets"]
+        self.assertEqual(
+            [(row["name"], row["count"]) for row in facets["categories"]], [("Цветы", 2), ("Подарки", 1)],
+        )
+        self.assertEqual(
+            facets["price"],
+            [
+                {"range": "0-100", "count": 1},
+                {"range": "100-500", "count": 1},
+                {"range": "500-1000", "count": 1},
+                {"range": "1000-5000", "count": 0},
+                {"range": "5000+", "count": 0},
+            ],
+        )
+
+    def test_index_follows_save_bulk_update_and_delete(self):
+        self.rose.title = "Тюльпан"
+        self.rose.save()
+        self.assertEqual(self.search_ids("тюльпан"), [self.rose.id])
+        self.assertEqual(self.search_ids("красная"), [])
+
+        self.card.title = "Тюльпаны в коробке"
+        Product.objects.bulk_update([self.card], ["title"])
+        self.assertEqual(self.search_ids("тюльпан"), [self.rose.id, self.card.id])
+
+        Product.objects.filter(id=self.bouquet.id).update(description="Пионы")
+        self.assertEqual(self.search_ids("роза"), [])
+
+        self.rose.delete()
+        self.assertEqual(self.search_ids("тюльпан"), [self.card.id])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+
+    def test_product_change_bumps_version(self):
+        key = catalog_cache.make_key("list", "page=1")
+        self.assertEqual(catalog_cache.read_through(key, lambda: ["старое"]), ["старое"])
+
+        category = Category.objects.create(name="Товары")
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title="Товар", price=10, category=category)
+
+        new_key = catalog_cache.make_key("list", "page=1")
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(catalog_cache.read_through(new_key, lambda: ["новое"]), ["новое"])
+
+    def test_lost_version_key_never_reopens_old_entries(self):
+        key = catalog_cache.make_key("list", "")
+        catalog_cache.read_through(key, lambda: ["старое"])
+        catalog_cache.bump_version()
+        bumped = catalog_cache.get_version()
+
+        # Ключ версии вытеснен из общего кэша, записи со старыми версиями ещё живы
+        cache.delete(CATALOG_VERSION_KEY)
+        catalog_cache._version = None
+        self.assertGreater(catalog_cache.get_version(), bumped)
+        cache.delete(CATALOG_VERSION_KEY)
+        catalog_cache.bump_version()
+        self.assertGreater(catalog_cache.get_version(), bumped)
+        self.assertEqual(catalog_cache.read_through(catalog_cache.make_key("list", ""), lambda: ["новое"]), ["новое"])
+
+    def test_none_result_is_cached(self):
+        build = mock.Mock(return_value=None)
+        key = catalog_cache.make_key("watermark", "")
+        self.assertIsNone(catalog_cache.read_through(key, build))
+        catalog_cache.local.clear()
+        self.assertIsNone(catalog_cache.read_through(key, build))
+        self.assertEqual(cache.get(key), NONE_MARKER)
+        build.assert_called_once_with()
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"count": 1}
+
+        key = catalog_cache.make_key("list", "")
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(catalog_cache.read_through(key, build)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"count": 1}] * 5)
+
+    def test_waiter_takes_result_of_lock_owner(self):
+        key = catalog_cache.make_key("list", "")
+        cache.add(f"{key}:lock", 1)
+        build = mock.Mock()
+        # Пока этот запрос ждёт, владелец блокировки записывает результат
+        with mock.patch("shop.cache.time.sleep", side_effect=lambda _: cache.set(key, ["готово"])):
+            self.assertEqual(catalog_cache.read_through(key, build), ["готово"])
+        build.assert_not_called()
+
+
+class ConditionalCatalogTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.category = Category.objects.create(name="Товары")
+        self.product = Product.objects.create(title="Товар", price=10, stock=5, category=self.category)
+        self.other = Product.objects.create(title="Другой", price=20, category=self.category)
+
+    def test_list_not_modified_without_serializing(self):
+        response = self.client.get("/api/products/")
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn("Last-Modified", response)
+
+        with mock.patch("shop.views.ProductSerializer.to_representation") as to_representation, \
+                self.assertNumQueries(0):
+            response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        to_representation.assert_not_called()
+
+        response = self.client.get("/api/products/?ordering=price", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_etag_changes_on_update_and_delete(self):
+        etag = self.client.get("/api/products/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.other.pk).update(price=30)
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.json()["results"]], [self.product.pk])
+
+    def test_detail_if_modified_since_and_stock_change(self):
+        url = f"/api/products/{self.product.pk}/"
+        response = self.client.get(url)
+        last_modified, etag = response["Last-Modified"], response["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Остаток меняется без сброса кэша каталога, но ETag и тело карточки обновляются
+        Product.objects.filter(pk=self.product.pk).update_stock(2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["stock"], 2)
+
+    def test_missing_product(self):
+        self.assertEqual(self.client.get("/api/products/999999/").status_code, 404)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        category = Category.objects.create(name="Товары")
+        self.product = Product.objects.create(
+            title="Товар", description="Длинное описание", price=10, stock=3, category=category,
+        )
+        Product.objects.create(title="Другой", price=5, category=category)
+
+    def test_list_is_compact_and_skips_description_column(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/products/")
+        item = response.json()["results"][0]
+        self.assertNotIn("description", item)
+        self.assertEqual(item["category"], "Товары")
+        self.assertTrue(all('"description"' not in query["sql"] for query in queries))
+
+    def test_requested_fields(self):
+        catalog_watermark()  # водяной знак для ETag считается отдельно и кэшируется
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/products/?fields=id,title,price&ordering=price")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([set(item) for item in results], [{"id", "title", "price"}] * 2)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("shop_category", queries[0]["sql"])
+
+        # Поле сортировки не отложено: курсор строится без дозапросов
+        with self.assertNumQueries(1):
+            page = self.client.get("/api/products/?fields=title&page_size=1").json()
+        self.assertEqual(self.client.get(page["next"]).json()["results"], [{"title": "Товар"}])
+
+        response = self.client.get(f"/api/products/{self.product.pk}/?fields=title,description")
+        self.assertEqual(response.json(), {"title": "Товар", "description": "Длинное описание"})
+
+    def test_unknown_field(self):
+        response = self.client.get("/api/products/?fields=id,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("fields", response.json())
+
+
+class FastListParityTests(TestCase):
+    """Быстрый путь (.values() + RowBuilder + orjson) отдаёт байт в байт то же, что сериализаторы."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media, PRODUCT_IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        category = Category.objects.create(name="Цветы")
+        buffer = io.BytesIO()
+        Image.new("RGB", (10, 10), "red").save(buffer, "JPEG")
+        self.rose = Product.objects.create(
+            # U+2028 JSONRenderer экранирует — orjson-путь обязан делать так же
+            title="Роза\u2028«красная»", description="Описание", price="10.5", discount_price="9.99",
+            stock=3, category=category,
+            image=SimpleUploadedFile("rose.jpg", buffer.getvalue(), content_type="image/jpeg"),
+        )
+        tulip = Product.objects.create(title="Тюльпан", price=7, category=category)
+        Cart.objects.create(user=self.user, product=self.rose, quantity=2)
+        Cart.objects.create(user=self.user, product=tulip, quantity=1)
+
+    def fetch(self, url, fast):
+        clear_catalog_cache()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with override_settings(API_FAST_LISTS=fast):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.content
+
+    def test_same_output(self):
+        for url in [
+            "/api/products/",
+            "/api/products/?ordering=price&page_size=1",
+            "/api/products/?fields=id,created_at,updated_at,price,discount_price,image,sku",
+            "/api/products/search/?q=роза",
+            "/api/cart/summary/",
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.fetch(url, fast=True), self.fetch(url, fast=False))
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def request(self, method="get", user_id=None):
+        request = getattr(self.factory, method)("/api/")
+        request.user = mock.Mock(pk=user_id, is_authenticated=True) if user_id else AnonymousUser()
+        return request
+
+    def test_catalog_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Product), "replica1")
+        self.assertEqual(self.router.db_for_read(Order), "replica1")
+        self.assertIsNone(self.router.db_for_read(Cart))
+        self.assertIsNone(self.router.db_for_read(User))
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertIsNone(self.router.db_for_read(Product))
+
+    def test_reads_inside_transaction_go_to_primary(self):
+        with mock.patch.object(connections["default"], "in_atomic_block", True):
+            self.assertEqual(self.router.db_for_read(Product), "default")
+
+    def test_read_your_writes(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Order))
+            if request.method == "POST":
+                self.router.db_for_write(Order)
+            seen.append(self.router.db_for_read(Order))
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        middleware(self.request(user_id=1))
+        self.assertEqual(seen, ["replica1", "replica1"])
+
+        seen.clear()
+        middleware(self.request("post", user_id=1))
+        self.assertEqual(seen, ["default", "default"])
+
+        # Следующие чтения этого пользователя — с основной БД, других — по-прежнему с реплики
+        seen.clear()
+        middleware(self.request(user_id=1))
+        middleware(self.request(user_id=2))
+        self.assertEqual(seen, ["default", "default", "replica1", "replica1"])
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        category = Category.objects.create(name="Цветы")
+        self.rose = Product.objects.create(title="Роза", price="10.50", stock=5, category=category)
+        self.tulip = Product.objects.create(title="Тюльпан", price=7, category=category)
+        self.order = Order.objects.create(user=self.user, phone="1", address="a", total_price=10)
+        self.client = AsyncClient()
+
+    def auth(self, user):
+        return {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    async def test_product_list_and_detail_match_sync_views(self):
+        for url in [
+            "products/?ordering=price&fields=id,title,price",
+            "products/?min_price=8",
+            f"products/{self.rose.pk}/",
+        ]:
+            expected = (await self.client.get(f"/api/{url}")).json()
+            response = await self.client.get(f"/api/async/{url}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected)
+
+        response = await self.client.get("/api/async/products/", headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        response = await self.client.get("/api/async/products/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.client.get("/api/async/products/?ordering=bad")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((await self.client.get("/api/async/products/999999/")).status_code, 404)
+
+    async def test_cart_add_and_read(self):
+        response = await self.client.post(
+            "/api/async/cart/add/", {"product_id": self.rose.pk, "quantity": 2},
+            content_type="application/json", headers=self.auth(self.user),
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["quantity"], 2)
+        # Тот же CartSerializer, что у синхронной корзины
+        [line] = (await self.client.get("/api/cart/", headers=self.auth(self.user))).json()
+        self.assertEqual(response.json(), line)
+
+        response = await self.client.get("/api/async/cart/summary/", headers=self.auth(self.user))
+        self.assertEqual(response.json()["subtotal"], "21.00")
+        self.assertEqual(response.json()["item_count"], 2)
+
+        response = await self.client.get("/api/async/cart/summary/")
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response)
+        response = await self.client.post(
+            "/api/async/cart/add/", {"product_id": 999999}, content_type="application/json", headers=self.auth(self.user),
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_order_status(self):
+        url = f"/api/async/orders/{self.order.pk}/status/"
+        response = await self.client.get(url, headers=self.auth(self.user))
+        self.assertEqual(response.json(), {"order_id": self.order.pk, "status": "pending"})
+
+        response = await self.client.post(
+            url, {"status": "lost"}, content_type="application/json", headers=self.auth(self.admin),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(await Order.objects.filter(status="lost").acount(), 0)
+
+        body = {"status": "shipped"}
+        response = await self.client.post(url, body, content_type="application/json", headers=self.auth(self.user))
+        self.assertEqual(response.status_code, 403)
+        response = await self.client.post(url, body, content_type="application/json", headers=self.auth(self.admin))
+        self.assertEqual(response.json()["new_status"], "shipped")
+        self.assertTrue(await Notification.objects.filter(user=self.user).aexists())
+
+        response = await self.client.post(
+            url, {"status": "pending"}, content_type="application/json", headers=self.auth(self.admin),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(await Order.objects.filter(status="shipped").acount(), 1)
+
+        other = await User.objects.acreate(username="other")
+        self.assertEqual((await self.client.get(url, headers=self.auth(other))).status_code, 404)
+
+
+class AsyncFCMSenderTests(TestCase):
+    def test_batch_sent_concurrently_with_results(self):
+        users = [User.objects.create_user(username=f"u{index}") for index in range(3)]
+        UserFCMToken.objects.create(user=users[0], fcm_token="ok")
+        UserFCMToken.objects.create(user=users[1], fcm_token="gone")
+        notifications = [
+            Notification.objects.create(user=user, title="Заказ", body="Отправлен", payload={"order_id": 1})
+            for user in users
+        ]
+
+        def handler(request):
+            message = json.loads(request.content)["message"]
+            self.assertEqual(request.headers["Authorization"], "Bearer secret")
+            self.assertEqual(message["data"], {"order_id": "1"})
+            return httpx.Response(200 if message["token"] == "ok" else 404)
+
+        credentials = mock.Mock(valid=True, token="secret", project_id="shop")
+        sender = AsyncFCMSender(transport=httpx.MockTransport(handler), credentials=credentials)
+        self.assertEqual(sender.send_batch(notifications), {
+            notifications[0].id: None,
+            notifications[1].id: SKIPPED,
+            notifications[2].id: SKIPPED,
+        })
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_user_served_from_cache(self):
+        self.assertEqual(self.client.get("/api/protected/").status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/protected/").status_code, 200)
+
+    def test_invalidated_on_staff_and_active_changes(self):
+        self.assertFalse(self.client.get("/api/admin-check/").json()["is_admin"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_staff = True
+            self.user.save()
+        self.assertTrue(self.client.get("/api/admin-check/").json()["is_admin"])
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/protected/").status_code, 401)
+
+
+class BonusLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.other = User.objects.create_user(username="other", password="pass")
+
+    def test_balance_matches_ledger(self):
+        credit(self.user.id, 100)
+        credit(self.user.id, 50)
+        debit(self.user.id, 30)
+        self.assertEqual(get_balance(self.user), 120)
+        self.assertEqual(Bonus.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(sum(self.user.bonus_transactions.values_list("amount", flat=True)), 120)
+
+    def test_debit_never_goes_negative(self):
+        credit(self.user.id, 10)
+        with self.assertRaises(InsufficientBonus):
+            debit(self.user.id, 11)
+        with self.assertRaises(InsufficientBonus):
+            debit(self.other.id, 1)
+        self.assertEqual(get_balance(self.user), 10)
+        self.assertEqual(BonusTransaction.objects.filter(kind="redemption").count(), 0)
+
+    def test_accrual_is_batched_and_once_per_order(self):
+        orders = [
+            Order.objects.create(user=user, address="Душанбе", total_price=price, status="delivered")
+            for user, price in [(self.user, 1000), (self.user, 505), (self.other, 300)]
+        ]
+        Order.objects.create(user=self.user, address="Душанбе", total_price=700, status="shipped")
+
+        with self.assertNumQueries(8):
+            self.assertEqual(accrue_delivered_orders(batch_size=2), 2)
+        self.assertEqual(accrue_delivered_orders(batch_size=2), 1)
+        self.assertEqual(accrue_delivered_orders(), 0)
+
+        self.assertEqual(get_balance(self.user), 150)
+        self.assertEqual(get_balance(self.other), 30)
+        self.assertEqual(
+            set(BonusTransaction.objects.filter(kind="accrual").values_list("order_id", flat=True)),
+            {order.id for order in orders},
+        )
+
+    def test_balance_endpoint(self):
+        credit(self.user.id, 42)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get("/api/api/bonuses/balance/").json(), {"balance": 42})
+
+    def test_accounts_are_read_only_and_scoped(self):
+        credit(self.user.id, 10)
+        credit(self.other.id, 20)
+        client = APIClient()
+        self.assertEqual(client.get("/api/api/bonuses/").status_code, 401)
+
+        client.force_authenticate(self.user)
+        accounts = client.get("/api/api/bonuses/").json()
+        self.assertEqual([account["total_bonus"] for account in accounts], [10])
+        other_id = Bonus.objects.get(user=self.other).id
+        self.assertEqual(client.get(f"/api/api/bonuses/{other_id}/").status_code, 404)
+        self.assertEqual(client.post("/api/api/bonuses/", {"user": self.user.id}, format="json").status_code, 405)
+        self.assertEqual(client.delete(f"/api/api/bonuses/{other_id}/").status_code, 405)
+
+        client.force_authenticate(User.objects.create_user(username="admin", password="pass", is_staff=True))
+        self.assertEqual(len(client.get("/api/api/bonuses/").json()), 2)
+
+    def test_migration_marks_historical_deliveries_accrued(self):
+        seed = importlib.import_module("shop.migrations.0019_seed_bonus_accruals")
+        old = Order.objects.create(user=self.user, address="Душанбе", total_price=1000, status="delivered")
+        seed.mark_delivered_orders_accrued(django_apps, None)
+        new = Order.objects.create(user=self.user, address="Душанбе", total_price=500, status="delivered")
+
+        self.assertEqual(accrue_delivered_orders(), 1)
+        self.assertEqual(get_balance(self.user), 50)
+        self.assertEqual(BonusTransaction.objects.get(order=old).amount, 0)
+        self.assertEqual(BonusTransaction.objects.get(order=new).amount, 50)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Товары")
+        self.product = Product.objects.create(title="Товар", price=100, category=category, stock=10)
+        Cart.objects.create(user=self.user, product=self.product, quantity=2)
+
+    def test_retry_replays_first_order_response(self):
+        first = self.client.post("/api/order/create/", HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(1):
+            retry = self.client.post("/api/order/create/", HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_different_request(self):
+        self.client.post("/api/order/create/", HTTP_IDEMPOTENCY_KEY="k")
+        response = self.client.post("/api/order/create/", {"address": "Худжанд"}, format="json", HTTP_IDEMPOTENCY_KEY="k")
+        self.assertEqual(response.status_code, 422)
+
+    def test_in_flight_key_conflicts(self):
+        IdempotencyKey.objects.create(
+            user=self.user, key="k", fingerprint="x", expires_at=timezone.now() + timedelta(minutes=1),
+        )
+        with mock.patch("shop.idempotency.request_fingerprint", return_value="x"):
+            response = self.client.post("/api/order/create/", HTTP_IDEMPOTENCY_KEY="k")
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_abandoned_in_flight_key_is_reclaimed(self):
+        IdempotencyKey.objects.create(
+            user=self.user, key="k", fingerprint="x", expires_at=timezone.now() + timedelta(hours=1),
+            claimed_at=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_IN_FLIGHT_LEASE + 1),
+        )
+        with mock.patch("shop.idempotency.request_fingerprint", return_value="x"):
+            response = self.client.post("/api/order/create/", HTTP_IDEMPOTENCY_KEY="k")
+            retry = self.client.post("/api/order/create/", HTTP_IDEMPOTENCY_KEY="k")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_keys_are_purged(self):
+        self.client.post("/api/order/create/", HTTP_IDEMPOTENCY_KEY="order-1")
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_expired_keys(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class PaymentGatewayTests(TestCase):
+    def setUp(self):
+        FakeGateway.sessions.clear()
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        category = Category.objects.create(name="Цветы")
+        self.rose = Product.objects.create(title="Роза", price=100, stock=5, category=category)
+        Cart.objects.create(user=self.user, product=self.rose, quantity=2)
+        self.order = place_order(self.user, address="Душанбе")
+        self.client = AsyncClient()
+
+    def auth(self):
+        return {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def start_payment(self):
+        payment = Payment.objects.create(order=self.order, method="card", amount=self.order.total_price)
+        session = async_to_sync(FakeGateway().acreate_session)(payment)
+        payment.session_id, payment.payment_url = session
+        payment.save()
+        return payment
+
+    def webhook(self, body, signature=None):
+        raw = json.dumps(body).encode()
+        return Client().post(
+            "/api/payment/webhook/", raw, content_type="application/json",
+            headers={"X-Payment-Signature": signature or sign_payload(raw)},
+        )
+
+    async def test_session_is_created_once(self):
+        payload = {"order_id": self.order.id, "payment_method": "card"}
+        first = await self.client.post("/api/payment/session/", payload, content_type="application/json", headers=self.auth())
+        # Старый адрес payment/process/ ведёт туда же и возвращает уже открытую сессию
+        retry = await self.client.post("/api/payment/process/", payload, content_type="application/json", headers=self.auth())
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()["payment_link"], first.json()["payment_link"])
+        payment = await Payment.objects.aget(order=self.order)
+        self.assertEqual((payment.status, payment.amount), ("pending", 200))
+        self.assertEqual(list(FakeGateway.sessions), [payment.session_id])
+
+    async def test_payment_under_review_is_not_reopened(self):
+        payment = await sync_to_async(self.start_payment)()
+        await Payment.objects.filter(id=payment.id).aupdate(status="needs_review")
+        response = await self.client.post(
+            "/api/payment/session/", {"order_id": self.order.id, "payment_method": "card"},
+            content_type="application/json", headers=self.auth(),
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            await Payment.objects.values_list("status", "session_id").aget(id=payment.id),
+            ("needs_review", payment.session_id),
+        )
+
+    def test_signed_webhook_marks_order_paid_once(self):
+        payment = self.start_payment()
+        body = {"session_id": payment.session_id, "status": "paid"}
+        self.assertEqual(self.webhook(body, signature="forged").status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.webhook(body)
+        self.assertEqual(response.json(), {"payment_id": payment.id, "status": "paid"})
+        self.assertEqual(self.webhook({**body, "status": "failed"}).json()["status"], "paid")
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "paid")
+        self.assertEqual(set(self.order.reservations.values_list("status", flat=True)), {"committed"})
+        self.assertEqual(Notification.objects.filter(payload__status="paid").count(), 1)
+        self.assertEqual(self.webhook({"session_id": "unknown", "status": "paid"}).status_code, 404)
+
+    def test_webhook_rejected_without_secret(self):
+        payment = self.start_payment()
+        body = {"session_id": payment.session_id, "status": "paid"}
+        signature = sign_payload(json.dumps(body).encode())
+        with override_settings(PAYMENT_WEBHOOK_SECRET=""):
+            self.assertEqual(self.webhook(body, signature=signature).status_code, 403)
+        self.assertEqual(Payment.objects.get(id=payment.id).status, "pending")
+
+    def test_reconcile_polls_only_stale_pending_payments(self):
+        fresh = self.start_payment()
+        Cart.objects.create(user=self.user, product=self.rose, quantity=1)
+        self.order = place_order(self.user, address="Душанбе")
+        stale = self.start_payment()
+        Payment.objects.filter(id=stale.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        FakeGateway.sessions[fresh.session_id] = FakeGateway.sessions[stale.session_id] = "failed"
+
+        gateway = FakeGateway()
+        with mock.patch.object(gateway, "afetch_status", wraps=gateway.afetch_status) as fetch:
+            self.assertEqual(reconcile_payments(gateway), 1)
+        fetch.assert_called_once_with(stale.session_id)
+        self.assertEqual(Payment.objects.get(id=stale.id).status, "failed")
+        self.assertEqual(Payment.objects.get(id=fresh.id).status, "pending")
+        self.assertEqual(reconcile_payments(gateway), 0)
+
+    def test_http_gateway(self):
+        def handler(request):
+            if request.method == "POST":
+                self.assertEqual(json.loads(request.content)["amount"], "200.00")
+                return httpx.Response(200, json={"id": "s1", "url": "https://bank.example/pay/s1"})
+            if request.url.path.endswith("/s1"):
+                return httpx.Response(200, json={"status": "paid"})
+            return httpx.Response(503)
+
+        gateway = HTTPGateway(transport=httpx.MockTransport(handler))
+        payment = Payment(order=self.order, method="card", amount=self.order.total_price)
+        with override_settings(PAYMENT_GATEWAY_URL="https://bank.example/api"):
+            session = async_to_sync(gateway.acreate_session)(payment)
+            statuses = async_to_sync(gateway.afetch_statuses)(["s1", "s2"])
+            with self.assertRaises(PaymentGatewayError):
+                async_to_sync(gateway.afetch_status)("s2")
+        self.assertEqual(session, ("s1", "https://bank.example/pay/s1"))
+        self.assertEqual(statuses, {"s1": "paid"})
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer", password="pass")
+        self.admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        flowers = Category.objects.create(name="Цветы")
+        gifts = Category.objects.create(name="Подарки")
+        self.rose = Product.objects.create(title="Роза", price=100, stock=50, category=flowers)
+        self.tulip = Product.objects.create(title="Тюльпан", price=50, discount_price=40, stock=50, category=flowers)
+        self.card = Product.objects.create(title="Открытка", price=10, stock=50, category=gifts)
+
+    def order(self, **quantities):
+        for name, quantity in quantities.items():
+            Cart.objects.create(user=self.user, product=getattr(self, name), quantity=quantity)
+        return place_order(self.user, address="Душанбе")
+
+    def rollups(self):
+        return {
+            "day": list(DailySales.objects.values_list("orders", "units", "revenue")),
+            "category": sorted(DailyCategorySales.objects.values_list("category__name", "orders", "units", "revenue")),
+            "product": sorted(DailyProductSales.objects.values_list("product__title", "orders", "units", "revenue")),
+        }
+
+    def test_rollups_follow_status_changes(self):
+        first = self.order(rose=2, tulip=1, card=3)
+        second = self.order(rose=1)
+        self.order(card=5)  # не оплачен — в продажи не попадает
+
+        first.status = "paid"
+        first.save()
+        Order.objects.filter(id=second.id).transition_to("paid")
+        first.status = "shipped"
+        first.save()
+        first.status = "delivered"
+        first.save()  # уже учтён при оплате — второй раз не прибавляется
+
+        # Цена позиции зафиксирована при оформлении
+        Product.objects.filter(id=self.rose.id).update(price=999)
+        self.assertEqual(self.rollups(), {
+            "day": [(2, 7, 370)],
+            "category": [("Подарки", 1, 3, 30), ("Цветы", 2, 4, 340)],
+            "product": [("Открытка", 1, 3, 30), ("Роза", 2, 3, 300), ("Тюльпан", 1, 1, 40)],
+        })
+
+        Order.objects.filter(id=second.id).transition_to("cancelled")
+        self.assertEqual(self.rollups()["day"], [(1, 6, 270)])
+
+    def test_rebuild_matches_incremental(self):
+        for quantities in [{"rose": 1, "card": 2}, {"tulip": 3}, {"card": 1}]:
+            order = self.order(**quantities)
+            order.status = "paid"
+            order.save()
+        Order.objects.filter(id=order.id).transition_to("cancelled")
+
+        incremental = self.rollups()
+        DailyProductSales.objects.update(units=0)
+        call_command("rebuild_sales_rollups", stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+        # Заказы до появления сводок: доставлены, но не учтены; цена позиции не сохранена
+        delivered = Order.objects.create(user=self.user, address="Душанбе", status="delivered")
+        OrderItem.objects.create(order=delivered, product=self.rose, quantity=1)
+        self.assertEqual(rebuild_sales(date_from=timezone.localdate()), 3)
+        self.assertEqual(self.rollups(), {
+            "day": [(3, 7, 340)],
+            "category": [("Подарки", 1, 2, 20), ("Цветы", 3, 5, 320)],
+            "product": [("Открытка", 1, 2, 20), ("Роза", 2, 2, 200), ("Тюльпан", 1, 3, 120)],
+        })
+
+    def test_analytics_endpoint_reads_only_rollups(self):
+        order = self.order(rose=1, card=2)
+        order.status = "paid"
+        order.save()
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        today = timezone.localdate().isoformat()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get("/api/analytics/sales/", {"group": "category"})
+        self.assertFalse(any("shop_order" in query["sql"] for query in ctx.captured_queries))
+        self.assertEqual(response.json()["totals"], {"orders": 1, "units": 3, "revenue": "120.00"})
+        self.assertEqual(
+            [(row["name"], row["revenue"]) for row in response.json()["results"]],
+            [("Цветы", "100.00"), ("Подарки", "20.00")],
+        )
+        day = client.get("/api/analytics/sales/", {"date_from": today, "date_to": today}).json()["results"]
+        self.assertEqual(day, [{"day": today, "orders": 1, "units": 3, "revenue": "120.00"}])
+
+        self.assertEqual(client.get("/api/analytics/sales/", {"group": "user"}).status_code, 400)
+        self.assertEqual(client.get("/api/analytics/sales/", {"date_from": "вчера"}).status_code, 400)
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get("/api/analytics/sales/").status_code, 403)
@@ -2,18 +2,20 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
-    ProductViewSet, OrderViewSet, BonusViewSet, 
+    CategoryViewSet, ProductViewSet, OrderViewSet, BonusViewSet, 
     RegisterView, ProtectedView, AdminCheckView,
-    ProductListCreateView, ProductDetailView, 
-    CartView, AddToCartView, RemoveFromCartView,
-    CreateOrderView, UpdateOrderStatusView,
-    PaymentProcessView,
+    ProductListCreateView, ProductDetailView, ProductSearchView, ProductImageVariantView,
+    CartView, CartSummaryView, AddToCartView, CartBatchView, RemoveFromCartView,
+    CreateOrderView, UpdateOrderStatusView, BulkOrderStatusView, OrderExportView,
+    SalesAnalyticsView,
 )
+from . import async_views
 
 # Роутер для ViewSet'ов
 router = DefaultRouter()
+router.register(r'categories', CategoryViewSet)
 router.register(r'products', ProductViewSet)
-router.register(r'orders', OrderViewSet)
+router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'bonuses', BonusViewSet)
 
 # Общий список маршрутов
@@ -25,11 +27,24 @@ urlpatterns = [
     path('protected/', ProtectedView.as_view(), name='protected'),
     path('admin-check/', AdminCheckView.as_view(), name='admin_check'),
     path('products/', ProductListCreateView.as_view(), name='product_list_create'),
+    path('products/search/', ProductSearchView.as_view(), name='product_search'),
+    path('products/<int:pk>/image/<str:variant>/', ProductImageVariantView.as_view(), name='product_image_variant'),
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product_detail'),
     path('cart/', CartView.as_view(), name='cart_view'),
+    path('cart/summary/', CartSummaryView.as_view(), name='cart_summary'),
     path('cart/add/', AddToCartView.as_view(), name='add_to_cart'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart_batch'),
     path('cart/remove/<int:product_id>/', RemoveFromCartView.as_view(), name='remove_from_cart'),
     path('order/create/', CreateOrderView.as_view(), name='create_order'),
     path('orders/update-status/', UpdateOrderStatusView.as_view(), name='update_order_status'),
-    path('payment/process/', PaymentProcessView.as_view(), name='payment_process'),
+    path('orders/bulk-status/', BulkOrderStatusView.as_view(), name='bulk_order_status'),
+    path('orders/export/', OrderExportView.as_view(), name='order_export'),
+    path('analytics/sales/', SalesAnalyticsView.as_view(), name='sales_analytics'),
+
+    # Асинхронные версии горячих эндпоинтов для ASGI-развёртывания (shop/async_views.py)
+    path('async/products/', async_views.product_list, name='async_product_list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async_product_detail'),
+    path('async/cart/summary/', async_views.cart_summary, name='async_cart_summary'),
+    path('async/cart/add/', async_views.cart_add, name='async_cart_add'),
+    path('async/orders/<int:order_id>/status/', async_views.order_status, name='async_order_status'),
 ]
@@ -1,38 +1,219 @@
+from django.db.models import Prefetch
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
 from django.shortcuts import render
-from rest_framework import viewsets, status
-from rest_framework.generics import CreateAPIView, ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from django.utils.functional import cached_property
+from PIL import UnidentifiedImageError
+from rest_framework import serializers, viewsets, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import CreateAPIView, ListAPIView, ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.views import APIView
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 
-from .models import Product, Order, OrderItem, Bonus, Cart, Payment, UserFCMToken
-from .serializers import ProductSerializer, OrderSerializer, BonusSerializer, CartSerializer, UserSerializer
+from .analytics import sales_report
+from .bonuses import get_balance
+from .cache import catalog_cache
+from .checkout import EmptyCartError, place_order
+from .conditional import catalog_watermark, conditional_response, product_watermark
+from .exports import EXPORT_FORMATS, ExportError, export_queryset, iter_export
+from .filters import ProductFilterBackend, get_product_ordering
+from .idempotency import idempotent
+from .images import generate_variant
+from .inventory import InsufficientStock, find_shortages, merge_quantities
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .rows import RowBuilder
+from .search import get_search_backend, get_search_facets
+from .models import Category, Product, Order, OrderItem, Bonus, Cart, UserFCMToken
+from .serializers import (
+    CategorySerializer, ProductSerializer, ProductListSerializer, OrderSerializer, BonusSerializer,
+    CartSerializer, CartLineSerializer, CartLineInputSerializer, CartBatchSerializer, UserSerializer,
+)
 
 
 # ===================== #
 #      ПРОДУКТЫ        #
 # ===================== #
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class CachedCatalogMixin:
+    """Отдаёт GET-ответы каталога из версионированного кэша (см. shop/cache.py)."""
+
+    def catalog_cache_key(self, namespace):
+        return catalog_cache.make_key(namespace, self.request.get_full_path())
+
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        key = self.catalog_cache_key("list")
+        data = catalog_cache.read_through(key, lambda: parent.list(request, *args, **kwargs).data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super()
+        key = self.catalog_cache_key("detail")
+        data = catalog_cache.read_through(key, lambda: parent.retrieve(request, *args, **kwargs).data)
+        return Response(data)
+
+
+class ConditionalCatalogMixin:
+    """
+    ETag и Last-Modified для товаров. 304 вычисляется по водяному знаку
+    (shop/conditional.py) до сериализации. Водяной знак входит и в ключ кэша
+    ответа, чтобы тело под ETag всегда совпадало с ним. Ставится перед
+    CachedCatalogMixin.
+    """
+
+    modified_at = None
+
+    def catalog_cache_key(self, namespace):
+        return catalog_cache.make_key(namespace, f"{self.request.get_full_path()}|{self.modified_at}")
+
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        self.modified_at = catalog_watermark()
+        return conditional_response(request, self.modified_at, lambda: parent.list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super()
+        self.modified_at = product_watermark(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        return conditional_response(request, self.modified_at, lambda: parent.retrieve(request, *args, **kwargs))
+
+
+class SparseFieldsViewMixin:
+    """
+    ?fields=id,title,price — в ответе и в SELECT только перечисленные поля
+    (из полного serializer_class). Без параметра списки отдаются компактным
+    list_serializer_class, и колонки выбираются по его полям.
+    """
+
+    list_serializer_class = None
+
+    @cached_property
+    def requested_fields(self):
+        if self.request.method != "GET":
+            return None
+        return self.serializer_class.parse_fields(self.request.query_params.get("fields"))
+
+    def is_list_request(self):
+        return self.request.method == "GET" and (self.lookup_url_kwarg or self.lookup_field) not in self.kwargs
+
+    def get_serializer_class(self):
+        if self.list_serializer_class and not self.requested_fields and self.is_list_request():
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"] = self.requested_fields
+        return context
+
+    def query_extra_columns(self):
+        return set()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != "GET":
+            return queryset
+        serializer_class = self.get_serializer_class()
+        fields = self.requested_fields or serializer_class.Meta.fields
+        if fields == "__all__":
+            return queryset
+        columns = serializer_class.query_columns(fields) | self.query_extra_columns()
+        if "category" not in columns:
+            queryset = queryset.select_related(None)
+        return queryset.only(*columns)
+
+
+class FastListMixin:
+    """
+    Быстрый путь для списков только на чтение (включается API_FAST_LISTS):
+    страница читается через .values() и собирается RowBuilder в тот же
+    JSON, что дал бы сериализатор, а кодируется orjson (FastJSONRenderer).
+    Ставится после кэширующих миксинов — в кэш попадает готовый результат.
+    """
+
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        if not settings.API_FAST_LISTS:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        builder = RowBuilder(self.get_serializer())
+        columns = list(builder.columns)
+        if self.paginator is not None:
+            # Курсору нужны значения полей сортировки, даже если их нет в ответе
+            ordering = self.paginator.get_ordering(request, queryset, self)
+            columns += [name.lstrip("-") for name in ordering if name.lstrip("-") not in columns]
+
+        page = self.paginate_queryset(queryset.values(*columns))
+        if page is not None:
+            return self.get_paginated_response([builder.build(row) for row in page])
+        return Response([builder.build(row) for row in queryset.values(*columns)])
+
+
+class CatalogQueryMixin(SparseFieldsViewMixin):
+    """Общие для всех маршрутов каталога выборка, фильтры и сортировка."""
+
+    queryset = Product.objects.select_related("category")
     serializer_class = ProductSerializer
+    list_serializer_class = ProductListSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [ProductFilterBackend]
 
+    def keyset_ordering(self):
+        return get_product_ordering(self.request)
 
-class ProductListCreateView(ListCreateAPIView):
-    queryset = Product.objects.all()
-    serializer_class = ProductSerializer
+    def query_extra_columns(self):
+        # Курсор читает поля сортировки у последнего объекта — они не должны быть отложены
+        columns = {field.name for field in Product._meta.concrete_fields}
+        return {name.lstrip("-") for name in self.keyset_ordering()} & columns
+
+
+class CategoryViewSet(CachedCatalogMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+
+
+class ProductViewSet(CatalogQueryMixin, ConditionalCatalogMixin, CachedCatalogMixin, FastListMixin, viewsets.ModelViewSet):
+    pass
 
+
+class ProductListCreateView(
+    CatalogQueryMixin, ConditionalCatalogMixin, CachedCatalogMixin, FastListMixin, ListCreateAPIView,
+):
     def get_permissions(self):
         if self.request.method == "POST":
             return [IsAuthenticated(), IsAdminUser()]
         return [AllowAny()]
 
 
-class ProductDetailView(RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.all()
+class ProductSearchView(CatalogQueryMixin, ConditionalCatalogMixin, CachedCatalogMixin, FastListMixin, ListAPIView):
+    """GET /api/products/search/?q=... — ранжированная выдача с фасетами по категориям и ценам."""
+
+    permission_classes = [AllowAny]
+
+    def get_queryset(self):
+        query = self.request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "Укажите поисковый запрос"})
+        return get_search_backend().search(super().get_queryset(), query)
+
+    def keyset_ordering(self):
+        return ("search_rank", "id")
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["facets"] = get_search_facets(self.filter_queryset(self.get_queryset()))
+        return response
+
+
+class ProductDetailView(SparseFieldsViewMixin, ConditionalCatalogMixin, CachedCatalogMixin, RetrieveUpdateDestroyAPIView):
+    queryset = Product.objects.select_related("category")
     serializer_class = ProductSerializer
 
     def get_permissions(self):
@@ -41,31 +222,66 @@ class ProductDetailView(RetrieveUpdateDestroyAPIView):
         return [AllowAny()]
 
 
+class ProductImageVariantView(APIView):
+    """
+    Редирект на уменьшенную копию фото. Если пул ещё не успел её создать,
+    она генерируется при первом запросе и дальше отдаётся из хранилища.
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk, variant):
+        if variant not in settings.PRODUCT_IMAGE_VARIANTS:
+            raise Http404
+        image_name = Product.objects.filter(pk=pk).values_list("image", flat=True).first()
+        if not image_name:
+            raise Http404
+        try:
+            path = generate_variant(image_name, variant)
+        except (FileNotFoundError, UnidentifiedImageError):
+            # Исходник удалён из хранилища или это не изображение
+            raise Http404
+        return HttpResponseRedirect(default_storage.url(path))
+
+
 # ===================== #
 #       ЗАКАЗЫ         #
 # ===================== #
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    История заказов текущего пользователя: курсор по (created_at, id), позиции и
+    товары — двумя запросами. Только чтение: заказы создаются оформлением
+    (CreateOrderView), статус меняет персонал.
+    """
+
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        items = OrderItem.objects.select_related("product").only(
+            "id", "order_id", "quantity",
+            "product__id", "product__title", "product__price", "product__discount_price", "product__image",
+        )
+        return Order.objects.filter(user=self.request.user).prefetch_related(Prefetch("items", queryset=items))
 
 
 class CreateOrderView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
-        cart_items = Cart.objects.filter(user=request.user)
-        if not cart_items.exists():
-            return Response({"error": "Корзина пуста"}, status=status.HTTP_400_BAD_REQUEST)
-
-        total_price = sum(item.product.get_final_price() * item.quantity for item in cart_items)
-        order = Order.objects.create(user=request.user, total_price=total_price)
-
-        for item in cart_items:
-            OrderItem.objects.create(order=order, product=item.product, quantity=item.quantity)
-
-        cart_items.delete()
+        try:
+            order = place_order(request.user)
+        except EmptyCartError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStock as e:
+            quantities = merge_quantities(Cart.objects.filter(user=request.user).values_list("product_id", "quantity"))
+            return Response(
+                {"error": str(e), "available": find_shortages(quantities)},
+                status=status.HTTP_409_CONFLICT,
+            )
         return Response({"message": "Заказ оформлен!", "order_id": order.id}, status=status.HTTP_201_CREATED)
 
 
@@ -84,36 +300,151 @@ class UpdateOrderStatusView(APIView):
         return Response({"message": "Статус заказа обновлён!", "new_status": order.status}, status=status.HTTP_200_OK)
 
 
+class BulkOrderStatusView(APIView):
+    """POST {"order_ids": [...], "status": "shipped"} — массовая смена статуса для склада."""
+
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    max_orders = 1000
+
+    def post(self, request):
+        order_ids = request.data.get("order_ids")
+        new_status = request.data.get("status")
+
+        if new_status not in dict(Order.STATUS_CHOICES):
+            return Response({"error": "Некорректный статус заказа"}, status=status.HTTP_400_BAD_REQUEST)
+        if (
+            not isinstance(order_ids, list) or not order_ids or len(order_ids) > self.max_orders
+            or not all(isinstance(order_id, int) for order_id in order_ids)
+        ):
+            return Response(
+                {"error": f"order_ids — непустой список id (не более {self.max_orders})"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        updated = Order.objects.filter(id__in=order_ids).transition_to(new_status)
+        skipped = sorted(set(order_ids) - set(updated))
+        return Response(
+            {"new_status": new_status, "updated": sorted(updated), "skipped": skipped},
+            status=status.HTTP_200_OK,
+        )
+
+
+class OrderExportView(APIView):
+    """
+    Потоковая выгрузка для бухгалтерии:
+    GET ?dataset=orders|items&output=csv|ndjson&date_from=&date_to=&status=
+    """
+
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    content_types = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+    def get(self, request):
+        params = request.query_params
+        output = params.get("output", "csv")
+        dataset = params.get("dataset", "orders")
+        if output not in EXPORT_FORMATS:
+            return Response({"error": f"output: допустимые значения {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            queryset, columns = export_queryset(
+                dataset, params.get("date_from"), params.get("date_to"), params.get("status"),
+            )
+        except ExportError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(iter_export(queryset, columns, output), content_type=self.content_types[output])
+        response["Content-Disposition"] = f'attachment; filename="{dataset}.{output}"'
+        return response
+
+
 # ===================== #
 #       КОРЗИНА        #
 # ===================== #
 
 class CartView(APIView):
+    """Корзина списком строк — формат, на который рассчитаны клиенты. Товары и категории — одним JOIN."""
+
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        cart_items = Cart.objects.filter(user=request.user)
-        serializer = CartSerializer(cart_items, many=True)
-        return Response(serializer.data)
+        cart_items = Cart.objects.filter(user=request.user).select_related("product__category").order_by("id")
+        return Response(CartSerializer(cart_items, many=True, context={"request": request}).data)
+
+
+class CartSummaryView(APIView):
+    """GET /api/cart/summary/ — строки с ценами и итоги корзины одним запросом (оконные суммы)."""
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        queryset = Cart.objects.filter(user=request.user).with_totals()
+        if settings.API_FAST_LISTS:
+            builder = RowBuilder(CartLineSerializer(context={"request": request}))
+            rows = list(queryset.values(*builder.columns, "cart_subtotal", "cart_item_count"))
+            items = [builder.build(row) for row in rows]
+            totals = rows[0] if rows else {}
+        else:
+            lines = list(queryset)
+            items = CartLineSerializer(lines, many=True, context={"request": request}).data
+            totals = vars(lines[0]) if lines else {}
+        return Response({
+            "items": items,
+            "subtotal": serializers.DecimalField(max_digits=12, decimal_places=2).to_representation(
+                totals.get("cart_subtotal", 0)
+            ),
+            "item_count": totals.get("cart_item_count", 0),
+        })
+
+
+def missing_products(product_ids):
+    existing = set(Product.objects.filter(id__in=product_ids).values_list("id", flat=True))
+    return sorted(set(product_ids) - existing)
 
 
 class AddToCartView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        serializer = CartSerializer(data=request.data)
-        if serializer.is_valid():
-            product_id = serializer.validated_data['product'].id
-            quantity = serializer.validated_data.get('quantity', 1)
+        serializer = CartLineInputSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        product_id = serializer.validated_data["product_id"]
+        quantity = serializer.validated_data["quantity"] or 1
+        if missing_products([product_id]):
+            return Response({"error": "Товар не найден"}, status=status.HTTP_404_NOT_FOUND)
+
+        [(cart_id, _, _)] = Cart.objects.add_lines(request.user, {product_id: quantity})
+        cart_item = Cart.objects.select_related("product__category").get(pk=cart_id)
+        return Response(CartSerializer(cart_item, context={"request": request}).data, status=status.HTTP_201_CREATED)
+
+
+class CartBatchView(APIView):
+    """Добавление/установка многих строк корзины одним запросом (восстановление корзины)."""
 
-            product = get_object_or_404(Product, id=product_id)
+    permission_classes = [IsAuthenticated]
 
-            cart_item, created = Cart.objects.get_or_create(user=request.user, product=product)
-            cart_item.quantity += quantity
-            cart_item.save()
+    def post(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        quantities = data["quantities"]
+        missing = missing_products(quantities)
+        if missing:
+            return Response({"error": "Товар не найден", "missing": missing}, status=status.HTTP_400_BAD_REQUEST)
+
+        if data["mode"] == "add":
+            rows = Cart.objects.add_lines(request.user, {pid: qty for pid, qty in quantities.items() if qty > 0})
+        else:
+            lines = Cart.objects.set_lines(request.user, quantities, replace=data["replace"])
+            rows = [(line.pk, line.product_id, line.quantity) for line in lines]
 
-            return Response(CartSerializer(cart_item).data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"items": [{"id": cart_id, "product_id": pid, "quantity": qty} for cart_id, pid, qty in rows]},
+            status=status.HTTP_200_OK,
+        )
 
 
 class RemoveFromCartView(APIView):
@@ -128,30 +459,31 @@ class RemoveFromCartView(APIView):
 
 
 # ===================== #
-#       ОПЛАТА         #
+#      АНАЛИТИКА       #
 # ===================== #
 
-class PaymentProcessView(APIView):
-    permission_classes = [IsAuthenticated]
+class SalesAnalyticsView(APIView):
+    """
+    GET ?group=day|category|product&date_from=&date_to=&limit= — продажи за
+    период. Читаются только дневные сводки (shop/analytics.py), поэтому время
+    ответа не зависит от объёма истории заказов.
+    """
 
-    def post(self, request):
-        order_id = request.data.get("order_id")
-        payment_method = request.data.get("payment_method")
-
-        order = get_object_or_404(Order, id=order_id, user=request.user)
-
-        # Проверяем, не была ли уже произведена оплата
-        if Payment.objects.filter(order=order).exists():
-            return Response({"error": "Этот заказ уже оплачен"}, status=status.HTTP_400_BAD_REQUEST)
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    max_limit = 500
+    money = serializers.DecimalField(max_digits=14, decimal_places=2)
 
-        payment = Payment.objects.create(order=order, method=payment_method, status="paid")
-        order.status = "Оплачено"
-        order.save()
+    def get(self, request):
+        params = request.query_params
+        try:
+            limit = min(int(params.get("limit", 50)), self.max_limit)
+            report = sales_report(params.get("group", "day"), params.get("date_from"), params.get("date_to"), limit)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(
-            {"message": "Оплата прошла успешно!", "order_id": order.id, "payment_method": payment.method},
-            status=status.HTTP_200_OK
-        )
+        for row in [report["totals"], *report["results"]]:
+            row["revenue"] = self.money.to_representation(row["revenue"])
+        return Response(report)
 
 
 # ===================== #
@@ -207,6 +539,19 @@ urlpatterns = [
     path("save_fcm_token/", save_fcm_token, name="save_fcm_token"),
 ]
 
-class BonusViewSet(viewsets.ModelViewSet):
+class BonusViewSet(viewsets.ReadOnlyModelViewSet):
+    """Бонусные счета: покупатель видит свой, персонал — все. Баланс меняют только операции журнала."""
+
     queryset = Bonus.objects.all()
-    serializer_class = BonusSerializer
\ No newline at end of file
+    serializer_class = BonusSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return self.queryset
+        return self.queryset.filter(user=self.request.user)
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def balance(self, request):
+        """GET .../bonuses/balance/ — баланс текущего пользователя одним чтением по индексу."""
+        return Response({"balance": get_balance(request.user)})
\ No newline at end of file
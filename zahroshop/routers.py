@@ -0,0 +1,121 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+_request_state = ContextVar("db_request_state", default=None)
+
+
+def pin_key(user_id):
+    return f"db:pinned:{user_id}"
+
+
+class RequestState:
+    """Что роутер знает о текущем запросе: была ли запись и закреплён ли пользователь за основной БД."""
+
+    def __init__(self, request):
+        self.request = request
+        # Изменяющий запрос читает с основной БД с самого начала: он проверяет то, что собирается менять
+        self.unsafe = request.method not in SAFE_METHODS
+        self.wrote = False
+        self._pinned = None
+
+    def use_primary(self):
+        return self.unsafe or self.wrote or self.pinned()
+
+    @property
+    def user_id(self):
+        # Для JWT пользователь появляется на request только после аутентификации DRF во view
+        user = getattr(self.request, "user", None)
+        return user.pk if user is not None and user.is_authenticated else None
+
+    def pinned(self):
+        if self._pinned is None:
+            user_id = self.user_id
+            if user_id is None:
+                return False
+            self._pinned = bool(cache.get(pin_key(user_id)))
+        return self._pinned
+
+
+class PrimaryReplicaRouter:
+    """
+    Чтение каталога и истории заказов (DATABASE_REPLICA_MODELS) уходит на
+    реплики из DATABASE_REPLICAS, всё остальное — на основную БД. Чтения
+    тоже идут на основную, если:
+
+    * открыта транзакция на основной БД (чтение внутри checkout и т.п.);
+    * запрос изменяющий (POST, PUT, ...) или в нём уже была запись;
+    * пользователь писал недавно — ReplicaPinningMiddleware закрепляет его
+      за основной БД на DATABASE_REPLICA_PIN_SECONDS, пока реплики догоняют.
+
+    Без настроенных реплик роутер ничего не меняет.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or model._meta.label not in settings.DATABASE_REPLICA_MODELS:
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        state = _request_state.get()
+        if state is not None and state.use_primary():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной БД, связи между объектами из разных алиасов допустимы
+        return True
+
+
+class ReplicaPinningMiddleware:
+    """Read-your-writes: после запроса с записью читаем данные пользователя с основной БД."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if self.should_pin(state):
+            cache.set(pin_key(state.user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if self.should_pin(state):
+            await cache.aset(pin_key(state.user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+        return response
+
+    def should_pin(self, state):
+        return state.wrote and bool(settings.DATABASE_REPLICAS) and state.user_id is not None
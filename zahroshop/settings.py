@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -34,6 +35,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'zahroshop.routers.ReplicaPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'zahroshop.urls'
@@ -56,10 +58,62 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'zahroshop.wsgi.application'
 
+# БД настраивается переменными окружения. По умолчанию — один файл SQLite в режиме WAL.
+# DB_PRIMARY — хост основной БД (или путь к файлу SQLite), DB_REPLICAS — через запятую
+# хосты реплик (или пути к файлам SQLite); локально можно
+# проверить на двух файлах: cp db.sqlite3 replica.sqlite3 && DB_REPLICAS=replica.sqlite3 ...
+DB_ENGINE = os.environ.get("DB_ENGINE", "django.db.backends.sqlite3")
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+
+# WAL: читатели не ждут писателя; IMMEDIATE: транзакция сразу берёт блокировку записи
+# и не падает с "database is locked" при попытке повысить её посреди checkout
+SQLITE_OPTIONS = {
+    "init_command": "PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;PRAGMA cache_size=-20000",
+    "transaction_mode": "IMMEDIATE",
+    "timeout": 20,
+}
+
+
+def database_config(location):
+    config = {
+        "ENGINE": DB_ENGINE,
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+    }
+    if DB_ENGINE == "django.db.backends.sqlite3":
+        config.update(NAME=BASE_DIR / location, OPTIONS=SQLITE_OPTIONS)
+    else:
+        config.update(
+            NAME=os.environ.get("DB_NAME", "zahroshop"),
+            HOST=location,
+            PORT=os.environ.get("DB_PORT", ""),
+            USER=os.environ.get("DB_USER", ""),
+            PASSWORD=os.environ.get("DB_PASSWORD", ""),
+        )
+    return config
+
+
 DATABASES = {
+    'default': database_config(os.environ.get("DB_PRIMARY", "db.sqlite3")),
+}
+DATABASE_REPLICAS = []
+for index, location in enumerate(filter(None, os.environ.get("DB_REPLICAS", "").split(",")), start=1):
+    alias = f"replica{index}"
+    # В тестах реплика — зеркало основной БД, отдельная тестовая база не создаётся
+    DATABASES[alias] = {**database_config(location.strip()), "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["zahroshop.routers.PrimaryReplicaRouter"]
+# Что можно читать с реплик: каталог и история заказов
+DATABASE_REPLICA_MODELS = ["shop.Category", "shop.Product", "shop.Order", "shop.OrderItem"]
+# Сколько секунд после записи читать данные пользователя с основной БД (read-your-writes)
+DATABASE_REPLICA_PIN_SECONDS = 10
+
+# В продакшене заменить на общий бэкенд (Redis/Memcached), иначе у каждого воркера свой кэш
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / "db.sqlite3",
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'zahroshop',
     }
 }
 
@@ -88,9 +142,82 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'shop.authentication.CachedJWTAuthentication',
     ),
 }
+# Сколько секунд пользователь из JWT живёт в кэше. Сброс при сохранении пользователя
+# доходит только до кэша своего процесса: с LocMemCache и несколькими воркерами
+# блокировка или смена прав в других процессах вступает в силу через этот срок.
+# Увеличивать только вместе с общим кэшем (Redis, Memcached).
+AUTH_USER_CACHE_TIMEOUT = 10
+
+# Курсорная пагинация каталога: размер страницы по умолчанию и верхняя граница ?page_size=
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Быстрый путь для списков только на чтение: .values() + RowBuilder + orjson (см. shop/rows.py).
+# Выключен по умолчанию: включать, когда сверка с сериализаторами (FastListParityTests) пройдена
+# на своих данных
+API_FAST_LISTS = False
+
+# Кэш ответов каталога (секунды): общий кэш, LRU процесса, проверка версии, блокировка пересчёта
+CATALOG_CACHE_TIMEOUT = 300
+CATALOG_CACHE_LOCAL_TIMEOUT = 30
+CATALOG_CACHE_LOCAL_SIZE = 512
+CATALOG_CACHE_VERSION_TTL = 1
+CATALOG_CACHE_LOCK_TIMEOUT = 5
+
+# Полнотекстовый поиск товаров. None — выбор по СУБД (FTS5 для SQLite, tsvector для PostgreSQL)
+PRODUCT_SEARCH_BACKEND = None
+PRODUCT_SEARCH_CONFIG = 'simple'  # должен совпадать с конфигурацией GIN-индекса в миграции
+SEARCH_PRICE_BUCKETS = [0, 100, 500, 1000, 5000]
+
+# Сколько секунд товар остаётся зарезервированным за неоплаченным заказом
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Сколько секунд хранится первый ответ на запрос с Idempotency-Key (чистит purge_idempotency_keys)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Сколько секунд запрос может держать ключ «в работе»; потом повтор занимает ключ сам (процесс упал)
+IDEMPOTENCY_IN_FLIGHT_LEASE = 60
+
+# Платёжный шлюз (shop.payments.FakeGateway — локальная заглушка, shop.payments.HTTPGateway — банк по HTTP)
+PAYMENT_GATEWAY = os.environ.get("PAYMENT_GATEWAY", "shop.payments.FakeGateway")
+PAYMENT_GATEWAY_URL = os.environ.get("PAYMENT_GATEWAY_URL", "")
+PAYMENT_GATEWAY_TOKEN = os.environ.get("PAYMENT_GATEWAY_TOKEN", "")
+PAYMENT_GATEWAY_TIMEOUT = 10
+PAYMENT_GATEWAY_CONCURRENCY = 10
+PAYMENT_CURRENCY = "TJS"
+# Секрет HMAC-подписи webhook'а банка. Вне DEBUG значения по умолчанию нет: без
+# переменной окружения все webhook'и отклоняются, а не проверяются публичной строкой
+PAYMENT_WEBHOOK_SECRET = os.environ.get("PAYMENT_WEBHOOK_SECRET", "dev-payment-webhook-secret" if DEBUG else "")
+# Через сколько секунд без webhook'а платёж сверяется командой reconcile_payments
+PAYMENT_RECONCILE_AFTER = 10 * 60
+
+# Бонусы за доставленный заказ, % от суммы (начисляет команда accrue_bonuses)
+BONUS_ACCRUAL_PERCENT = 10
+
+# Очередь push-уведомлений: способ доставки (shop.notifications.LocalSender — заглушка для разработки,
+# FCMSender — по одному блокирующему вызову через fcm_django), число попыток и базовая пауза
+# повтора в секундах (удваивается с каждой попыткой)
+NOTIFICATION_SENDER = 'shop.notifications.AsyncFCMSender'
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_RETRY_BASE = 30
+# На сколько секунд воркер «арендует» пачку на время отправки (больше, чем отправка пачки с таймаутами FCM)
+NOTIFICATION_LEASE = 5 * 60
+# AsyncFCMSender: одновременных запросов к FCM на пачку и таймаут запроса в секундах
+FCM_CONCURRENCY = 20
+FCM_TIMEOUT = 10
+
+# Варианты фото товара: имя -> максимальный размер (ширина, высота). Создаются в пуле
+# из PRODUCT_IMAGE_WORKERS потоков после загрузки; 0 — только лениво при первом запросе
+PRODUCT_IMAGE_VARIANTS = {
+    'thumb': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+PRODUCT_IMAGE_FORMAT = 'WEBP'
+PRODUCT_IMAGE_QUALITY = 80
+PRODUCT_IMAGE_WORKERS = 2
 
 import os
 
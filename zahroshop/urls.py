@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
@@ -15,3 +17,6 @@ urlpatterns = [
     path("api/order/update_status/", update_order_status, name="update_order_status"),  # ✅ Исправленный путь
     path("api/", include("api.urls")),  # Подключаем маршруты API
 ]
+
+# В разработке Django сам раздаёт загруженные фото и их варианты
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)